@@ -1,12 +1,11 @@
+import datetime
 import os
 
 import polars as pl
 
-def concat(a_df, b_df):
-    try:
-        return pl.concat([a_df, b_df], how='diagonal_relaxed')
-    except (pl.exceptions.SchemaError, pl.exceptions.PanicException):
-        return pl.DataFrame(a_df.to_dicts() + b_df.to_dicts(), infer_schema_length=len(a_df) + len(b_df))
+from hashtags import HashtagMatrix
+from utils import concat
+from video_store import VideoStore
 
 def main():
     # df = pl.DataFrame()
@@ -17,10 +16,20 @@ def main():
     #         except Exception as e:
     #             print(f"Error processing file {filename}: {e}")
 
-    df = pl.read_parquet('./data/fetched_election_videos.parquet.zstd')
+    # the crawler keeps these videos in a store, which is already deduplicated
+    df = VideoStore('./data/fetched_election_videos').load()
 
-    df = df.unique('id')
-    df = df.with_columns(pl.col('desc').str.extract_all(r'#(?P<hashtag>[a-zA-Z0-9_]+)').alias('hashtags'))
+    # hashtag counts, pairs used together more than chance and the week on week risers
+    hashtag_matrix = HashtagMatrix.build(df)
+    hashtag_df = hashtag_matrix.counts()
+    pair_df = hashtag_matrix.cooccurrence(min_count=20).sort('pmi', descending=True)
+    trending_df = hashtag_matrix.trending(every=datetime.timedelta(days=7))
+
+    os.makedirs('./data/analysis', exist_ok=True)
+    for name, result_df in [('hashtag_counts', hashtag_df), ('hashtag_pairs', pair_df), ('hashtag_trending', trending_df)]:
+        result_df.write_csv(f'./data/analysis/{name}.csv')
+        print(name)
+        print(result_df.head(20))
     
     # country list
     country_df = df.select(['locationCreated']).drop_nulls()['locationCreated'].value_counts().sort('count')
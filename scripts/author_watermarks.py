@@ -0,0 +1,83 @@
+import datetime
+import json
+import sqlite3
+
+import polars as pl
+
+class AuthorWatermarks:
+    """Per author collection state in SQLite, held in a dict for O(1) lookups.
+
+    Each author has the createTime of their newest unpinned video already collected, when they were
+    last scraped and the ids of their pinned videos. Updates are staged in memory and only written
+    by commit(), which callers run after the videos behind them have been stored, so a crash never
+    leaves a watermark ahead of the data.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS authors ('
+            'handle TEXT PRIMARY KEY, last_create_time INTEGER, last_scraped TEXT, pinned_ids TEXT)'
+        )
+        self.conn.commit()
+        self.authors = {
+            handle: {'last_create_time': last_create_time, 'last_scraped': last_scraped, 'pinned_ids': json.loads(pinned_ids)}
+            for handle, last_create_time, last_scraped, pinned_ids in self.conn.execute('SELECT * FROM authors')
+        }
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.authors)
+
+    def __contains__(self, handle):
+        return handle in self.authors
+
+    def get(self, handle):
+        return self.pending.get(handle, self.authors.get(handle))
+
+    def limit_date(self, handle, default=datetime.datetime(2022, 1, 1)):
+        watermark = self.get(handle)
+        if watermark is None or watermark['last_create_time'] is None:
+            return default
+        return datetime.datetime.fromtimestamp(watermark['last_create_time'])
+
+    def update(self, handle, videos):
+        """Stage the watermark of handle after collecting videos"""
+        watermark = self.get(handle) or {'last_create_time': None, 'last_scraped': None, 'pinned_ids': []}
+        create_times = [int(v['createTime']) for v in videos if not v.get('isPinnedItem', False)]
+        if watermark['last_create_time'] is not None:
+            create_times.append(watermark['last_create_time'])
+        pinned_ids = [str(v['id']) for v in videos if v.get('isPinnedItem', False)]
+        self.pending[handle] = {
+            'last_create_time': max(create_times) if len(create_times) > 0 else None,
+            'last_scraped': datetime.datetime.now().isoformat(),
+            'pinned_ids': pinned_ids if len(pinned_ids) > 0 else watermark['pinned_ids'],
+        }
+
+    def commit(self):
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO authors (handle, last_create_time, last_scraped, pinned_ids) VALUES (?, ?, ?, ?)',
+            [(handle, w['last_create_time'], w['last_scraped'], json.dumps(w['pinned_ids'])) for handle, w in self.pending.items()]
+        )
+        self.conn.commit()
+        self.authors.update(self.pending)
+        self.pending = {}
+
+    def seed(self, video_df):
+        """Initialise watermarks from videos already collected, in one pass over them"""
+        if len(video_df) == 0:
+            return
+        pinned = pl.col('isPinnedItem').fill_null(False) if 'isPinnedItem' in video_df.columns else pl.lit(False)
+        author_df = video_df.group_by(pl.col('author').struct.field('uniqueId').alias('handle'))\
+            .agg([
+                pl.col('createTime').cast(pl.Int64).filter(~pinned).max().alias('last_create_time'),
+                pl.col('id').cast(pl.String).filter(pinned).alias('pinned_ids'),
+            ])
+        for row in author_df.iter_rows(named=True):
+            if row['handle'] not in self.authors:
+                self.pending[row['handle']] = {'last_create_time': row['last_create_time'], 'last_scraped': None, 'pinned_ids': row['pinned_ids']}
+        self.commit()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import time
+
+import whisperx
+
+from transcribe import load_audio_from_bytes, try_create_audio
+
+def mp3_round_trip(file_byte_string, tmp_path):
+    # the previous path, writing the mp4, encoding an mp3 with moviepy and decoding it again
+    video_path = os.path.join(tmp_path, 'video.mp4')
+    audio_file_path = os.path.join(tmp_path, 'video.mp3')
+    with open(video_path, 'wb') as f:
+        f.write(file_byte_string)
+    if not try_create_audio(video_path, audio_file_path):
+        return None
+    audio = whisperx.load_audio(audio_file_path)
+    os.remove(audio_file_path)
+    os.remove(video_path)
+    return audio
+
+def main():
+    media_dir = sys.argv[1] if len(sys.argv) > 1 else './data/mp4s'
+    num_videos = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    filenames = sorted(f for f in os.listdir(media_dir) if f.endswith('.mp4'))[:num_videos]
+
+    timings = {'mp3 round trip': 0, 'ffmpeg pipe': 0}
+    audio_seconds = 0
+    with tempfile.TemporaryDirectory() as tmp_path:
+        for filename in filenames:
+            with open(os.path.join(media_dir, filename), 'rb') as f:
+                file_byte_string = f.read()
+
+            start = time.perf_counter()
+            mp3_round_trip(file_byte_string, tmp_path)
+            timings['mp3 round trip'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            audio = load_audio_from_bytes(file_byte_string)
+            timings['ffmpeg pipe'] += time.perf_counter() - start
+            if audio is not None:
+                audio_seconds += len(audio) / 16000
+
+    print(f"{len(filenames)} videos, {audio_seconds:.0f}s of audio")
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.2f}s total, {seconds / max(len(filenames), 1) * 1000:.0f}ms per video")
+
+if __name__ == '__main__':
+    main()
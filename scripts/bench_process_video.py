@@ -0,0 +1,71 @@
+import json
+import os
+import sys
+import time
+
+from download_videos import ProcessVideo
+
+class RecordedResponse:
+    status_code = 200
+    encoding = 'utf-8'
+
+class QuadraticProcessVideo:
+    # the previous implementation, re-scanning the whole accumulated text on every chunk
+    def __init__(self):
+        self.text = ""
+        self.start = -1
+        self.json_start = '"webapp.video-detail":'
+        self.json_start_len = len(self.json_start)
+        self.end = -1
+        self.json_end = ',"webapp.a-b":'
+
+    def process_chunk(self, text_chunk):
+        self.text += text_chunk
+        if len(self.text) < self.json_start_len:
+            return 'continue'
+        if self.start == -1:
+            self.start = self.text.find(self.json_start)
+            if self.start != -1:
+                self.text = self.text[self.start + self.json_start_len:]
+                self.start = 0
+        if self.start != -1:
+            self.end = self.text.find(self.json_end)
+            if self.end != -1:
+                self.text = self.text[:self.end]
+                return 'break'
+        return 'continue'
+
+def synthetic_page(size):
+    video_detail = json.dumps({'statusCode': 0, 'itemInfo': {'itemStruct': {'id': '1', 'desc': 'x' * (size // 10)}}})
+    padding = '<div>' + 'a' * size + '</div>'
+    return f'<html>{padding}<script>{{"__DEFAULT_SCOPE__":{{"webapp.video-detail":{video_detail},"webapp.a-b":{{}}}}}}</script>{padding}</html>'
+
+def load_fixtures(fixture_dir):
+    if os.path.isdir(fixture_dir):
+        fixtures = {}
+        for filename in sorted(os.listdir(fixture_dir)):
+            if filename.endswith('.html'):
+                with open(os.path.join(fixture_dir, filename), 'r', encoding='utf-8') as f:
+                    fixtures[filename] = f.read()
+        if len(fixtures) > 0:
+            return fixtures
+    print(f"No recorded fixtures in {fixture_dir}, using synthetic pages")
+    return {f'synthetic_{size}': synthetic_page(size) for size in [100_000, 1_000_000, 5_000_000]}
+
+def run(processor, text, chunk_size):
+    start = time.perf_counter()
+    for i in range(0, len(text), chunk_size):
+        if processor.process_chunk(text[i:i + chunk_size]) == 'break':
+            break
+    return time.perf_counter() - start
+
+def main():
+    fixture_dir = sys.argv[1] if len(sys.argv) > 1 else './data/html_fixtures'
+    chunk_size = 8192
+    for name, text in load_fixtures(fixture_dir).items():
+        linear = run(ProcessVideo(RecordedResponse()), text, chunk_size)
+        quadratic = run(QuadraticProcessVideo(), text, chunk_size)
+        print(f"{name}: {len(text) / 1e6:.1f}MB, streaming {linear * 1000:.1f}ms, previous {quadratic * 1000:.1f}ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from crawler import RelatedCrawler
+from frontier import Frontier
+
+class FakeVideo:
+    def __init__(self, backend, video_id):
+        self.backend = backend
+        self.id = str(video_id)
+
+    async def info(self):
+        await asyncio.sleep(self.backend.latency)
+        if self.id not in self.backend.videos:
+            raise Exception(f"Video {self.id} not found")
+        return dict(self.backend.videos[self.id]['info'])
+
+    async def related_videos(self):
+        await asyncio.sleep(self.backend.latency)
+        for related in self.backend.videos.get(self.id, {}).get('related', []):
+            yield dict(related)
+
+class FakeTikTok:
+    """Stands in for PyTok, serving canned video info and related videos with a fixed latency"""
+    def __init__(self, videos, latency):
+        self.videos = videos
+        self.latency = latency
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    def video(self, username=None, id=None):
+        return FakeVideo(self, id)
+
+def synthetic_videos(num_videos, num_related, keyword_rate, seed=0):
+    rng = random.Random(seed)
+    infos = {
+        str(i): {
+            'id': str(i),
+            'desc': 'carney canada' if rng.random() < keyword_rate else 'cooking',
+            'author': {'uniqueId': f'user{i % 100}'},
+            'authorStats': {'followerCount': rng.randint(0, 100_000)},
+        }
+        for i in range(num_videos)
+    }
+    return {
+        video_id: {'info': info, 'related': [infos[str(rng.randrange(num_videos))] for _ in range(num_related)]}
+        for video_id, info in infos.items()
+    }
+
+def load_videos(path):
+    # canned responses as {id: {"info": {...}, "related": [{...}, ...]}}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    print(f"No canned responses at {path}, using synthetic videos")
+    return synthetic_videos(2000, 20, 0.3)
+
+def reachable(videos, seeds, frontier):
+    # every video the crawl should end up fetching, by walking the canned graph
+    to_visit = [item for item in seeds if frontier.matches(item)]
+    seen = {item['id'] for item in to_visit}
+    while len(to_visit) > 0:
+        item = to_visit.pop()
+        for related in videos.get(item['id'], {}).get('related', []):
+            if related['id'] not in seen and frontier.matches(related):
+                seen.add(related['id'])
+                to_visit.append(related)
+    return seen
+
+async def crawl(videos, seeds, keywords, num_sessions, latency):
+    frontier = Frontier(keywords=keywords)
+    for item in seeds:
+        frontier.push(item, depth=0)
+    fetched = set()
+
+    def save_result(item, depth, video_info, related_videos):
+        fetched.add(video_info['id'])
+        for related in related_videos:
+            frontier.push(related, depth=depth + 1)
+
+    crawler = RelatedCrawler(
+        frontier,
+        lambda: FakeTikTok(videos, latency),
+        save_result,
+        num_sessions=num_sessions,
+        request_delay=0
+    )
+    start = time.perf_counter()
+    await crawler.run()
+    return fetched, time.perf_counter() - start
+
+def main():
+    # python bench_related_crawl.py [canned responses json]
+    path = sys.argv[1] if len(sys.argv) > 1 else './data/fixtures/related_videos.json'
+    videos = load_videos(path)
+    keywords = ['canada', 'carney']
+    seeds = [v['info'] for v in list(videos.values())[:10]]
+    expected = reachable(videos, seeds, Frontier(keywords=keywords))
+
+    for num_sessions in [1, 4, 8]:
+        fetched, elapsed = asyncio.run(crawl(videos, seeds, keywords, num_sessions, latency=0.01))
+        assert fetched == expected, f"Fetched {len(fetched)} videos, expected {len(expected)}"
+        print(f"{num_sessions} sessions: {len(fetched)} videos in {elapsed:.2f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+
+import torch
+
+from transcribe import SAMPLE_RATE, load_audio_from_bytes, load_whisper_model, select_backend, transcribe_clips
+
+CONFIGS = [
+    # device, compute type, clips per batch
+    ('cuda', 'float16', 1),
+    ('cuda', 'float16', 8),
+    ('cpu', 'int8', 1),
+    ('cpu', 'int8', 8),
+    ('cpu', 'float32', 1),
+]
+
+def main():
+    media_dir = sys.argv[1] if len(sys.argv) > 1 else './data/mp4s'
+    num_videos = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    filenames = sorted(f for f in os.listdir(media_dir) if f.endswith('.mp4'))[:num_videos]
+
+    audios = []
+    for filename in filenames:
+        with open(os.path.join(media_dir, filename), 'rb') as f:
+            audio = load_audio_from_bytes(f.read())
+        if audio is not None:
+            audios.append(audio)
+    audio_seconds = sum(len(audio) for audio in audios) / SAMPLE_RATE
+    print(f"{len(audios)} clips, {audio_seconds:.0f}s of audio")
+
+    for device, compute_type, clips_per_batch in CONFIGS:
+        if device == 'cuda' and not torch.cuda.is_available():
+            continue
+        device, compute_type, threads = select_backend(device, compute_type)
+        model = load_whisper_model(device, compute_type, threads)
+
+        start = time.perf_counter()
+        for i in range(0, len(audios), clips_per_batch):
+            transcribe_clips(model, audios[i:i + clips_per_batch])
+        elapsed = time.perf_counter() - start
+
+        # real time factor, seconds of compute per second of audio
+        print(f"{device} {compute_type} {threads} threads, {clips_per_batch} clips per batch: RTF {elapsed / audio_seconds:.3f}, {elapsed:.1f}s")
+        del model
+        if device == 'cuda':
+            torch.cuda.empty_cache()
+
+if __name__ == '__main__':
+    main()
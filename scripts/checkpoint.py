@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import sqlite3
+
+# enough of a video to fetch it again, match its keywords and recompute its priority
+FRONTIER_FIELDS = ['id', 'desc', 'challenges', 'author', 'authorStats']
+
+class CrawlCheckpoint:
+    """Crawl state in a SQLite database, so a crawl can resume exactly where it stopped.
+
+    Every id ever enqueued has a row with its queue position, depth, status and a trimmed copy of
+    the item. Frontier pushes and pops are recorded as they happen and made durable by commit(),
+    which the crawler calls once per aggregated result. Videos popped but not committed as done are
+    put back in the queue on resume. snapshot() copies the database to a temp file and renames it
+    into place, and is used instead if the main database is found corrupt on open.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.snapshot_path = f'{path}.snapshot'
+        if os.path.exists(self.path) and os.path.exists(self.snapshot_path) and not self._is_intact():
+            print(f"Checkpoint {self.path} is corrupt, restoring from snapshot")
+            for suffix in ['', '-wal', '-shm']:
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+            shutil.copyfile(self.snapshot_path, self.path)
+
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS frontier ('
+            'id TEXT PRIMARY KEY, seq INTEGER, depth INTEGER, status TEXT, item TEXT)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS frontier_status_seq ON frontier (status, seq)')
+        self.conn.commit()
+        self.seq = self.conn.execute('SELECT COALESCE(MAX(seq), 0) FROM frontier').fetchone()[0]
+
+    def _is_intact(self):
+        try:
+            with sqlite3.connect(self.path) as conn:
+                return conn.execute('PRAGMA quick_check').fetchone()[0] == 'ok'
+        except sqlite3.DatabaseError:
+            return False
+
+    def has_state(self):
+        return self.seq > 0
+
+    def record_push(self, item, depth):
+        self.seq += 1
+        item = {k: item.get(k) for k in FRONTIER_FIELDS}
+        self.conn.execute(
+            'INSERT OR IGNORE INTO frontier (id, seq, depth, status, item) VALUES (?, ?, ?, ?, ?)',
+            (str(item['id']), self.seq, depth, 'pending', json.dumps(item, default=str))
+        )
+
+    def record_pop(self, video_id):
+        self._set_status(video_id, 'in_flight')
+
+    def mark_done(self, video_id):
+        self._set_status(video_id, 'done')
+
+    def mark_failed(self, video_id):
+        self._set_status(video_id, 'failed')
+
+    def _set_status(self, video_id, status):
+        self.conn.execute('UPDATE frontier SET status = ? WHERE id = ?', (status, str(video_id)))
+
+    def commit(self):
+        self.conn.commit()
+
+    def restore(self, frontier):
+        """Refill the frontier's seen set and queue in the order items were originally pushed"""
+        frontier.mark_seen(row[0] for row in self.conn.execute('SELECT id FROM frontier'))
+        rows = self.conn.execute(
+            "SELECT item, depth FROM frontier WHERE status IN ('pending', 'in_flight') ORDER BY seq"
+        )
+        for item, depth in rows:
+            frontier.enqueue(json.loads(item), depth)
+        self.conn.execute("UPDATE frontier SET status = 'pending' WHERE status = 'in_flight'")
+        self.commit()
+
+    def snapshot(self):
+        self.commit()
+        tmp_path = f'{self.snapshot_path}.tmp'
+        with sqlite3.connect(tmp_path) as snapshot_conn:
+            self.conn.backup(snapshot_conn)
+        snapshot_conn.close()
+        os.replace(tmp_path, self.snapshot_path)
+
+    def close(self):
+        self.commit()
+        self.conn.close()
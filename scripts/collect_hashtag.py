@@ -1,19 +1,17 @@
 import asyncio
-import datetime
-import json
 import os
 
-import polars as pl
 from pytok.tiktok import PyTok
 from TikTokApi import TikTokApi
-from tqdm import tqdm
 
-from utils import concat
+from collection_runner import CollectionRunner, Source
+from video_info import USER_VIDEO_FIELDS, InfoFetcher
 
 class ApiWrapper:
     def __init__(self, lib):
         self.lib = lib
         self.api = None
+        self.fetcher = InfoFetcher(USER_VIDEO_FIELDS)
 
     async def __aenter__(self):
         if self.lib == 'pytok':
@@ -25,44 +23,52 @@ class ApiWrapper:
             await self.api.create_sessions(ms_tokens=[None], num_sessions=1, sleep_after=3, browser=os.getenv("TIKTOK_BROWSER", "chromium"))
         return self
     
-    async def get_hashtag_videos(self, hashtag_name):
+    async def get_hashtag_videos(self, hashtag_name, count=1000, known=None):
         hashtag = self.api.hashtag(name=hashtag_name)
 
         videos = []
-        async for video in hashtag.videos(count=1000):
+        async for video in hashtag.videos(count=count):
             video_info = video.as_dict
+            if known is not None and known.stop(video_info['id']):
+                break
             videos.append(video_info)
 
         return videos
 
+    async def get_search_videos(self, term, count=1000, known=None):
+        videos = []
+        async for video in self.api.search(term).videos(count=count):
+            if known is not None and known.stop(video.id):
+                break
+            videos.append(await self.fetcher.info(video))
+        return videos
+
     async def __aexit__(self, exc_type, exc, tb):
         await self.api.__aexit__(exc_type, exc, tb)
 
-async def main():
-    hashtags = [
-        'canadaelection', '51ststate', 'canadapoli', 'canadianpolitics', 'cdnpoli',\
-        'markcarney', 'pierrepoilievre', 'poilievre', 'jagmeetsingh', 'carney', 'elbowsup',\
-        'canadanews', 'cdnpolitics', 'neverpoilievre', 'canadianresisters', 'canadianelection'
+HASHTAGS = [
+    'canadaelection', '51ststate', 'canadapoli', 'canadianpolitics', 'cdnpoli',\
+    'markcarney', 'pierrepoilievre', 'poilievre', 'jagmeetsingh', 'carney', 'elbowsup',\
+    'canadanews', 'cdnpolitics', 'neverpoilievre', 'canadianresisters', 'canadianelection'
+]
+
+def hashtag_sources(hashtags):
+    return [
+        Source(f'#{hashtag_name}', f'./data/hashtag_{hashtag_name}', lambda api, known, hashtag_name=hashtag_name: api.get_hashtag_videos(hashtag_name, known=known))
+        for hashtag_name in hashtags
     ]
-    # hashtags.reverse()
 
-    async with ApiWrapper('pytok') as api:
-        for hashtag_name in tqdm(hashtags):
-            try:
-                videos = await api.get_hashtag_videos(hashtag_name)
+def search_sources(terms):
+    return [
+        Source(f'search {term}', f'./data/{term}', lambda api, known, term=term: api.get_search_videos(term, known=known))
+        for term in terms
+    ]
 
-                df = pl.DataFrame(videos)
-                df = df.with_columns(pl.lit(datetime.datetime.today()).alias('scrape_date'))
-                file_path = f'./data/hashtag_{hashtag_name}.parquet.zstd'
-                print(f'Saving {len(df)} new videos to {file_path}')
-                if os.path.exists(file_path):
-                    existing_df = pl.read_parquet(file_path)
-                    df = concat(existing_df, df)
-                df = df.unique('id')
-                df.write_parquet(file_path, compression='zstd')
-            except Exception as e:
-                print(f"Error fetching videos for hashtag {hashtag_name}: {e}")
-                continue
+async def main(num_sessions=4, terms=(), stop_after=None):
+    # search terms can ride along in the same session pool, as with main(terms=search.TERMS)
+    # for a daily refresh, stop_after=50 stops each hashtag at the first 50 videos in a row already stored
+    runner = CollectionRunner(hashtag_sources(HASHTAGS) + search_sources(terms), lambda: ApiWrapper('pytok'), num_sessions=num_sessions, stop_after=stop_after)
+    await runner.run()
 
 if __name__ == "__main__":
     asyncio.run(main())
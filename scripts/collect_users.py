@@ -8,17 +8,14 @@ import polars as pl
 from pytok.tiktok import PyTok, NotAvailableException, TimeoutException, NoContentException
 from tqdm import tqdm
 
-hashtag_name = 'romania'
+from author_watermarks import AuthorWatermarks
+from video_info import USER_VIDEO_FIELDS, InfoFetcher
+from video_store import VideoStore
 
-def concat(df, dicts):
-    try:
-        df = pl.concat([df, pl.DataFrame(dicts)], how='diagonal_relaxed')
-    except (pl.exceptions.SchemaError, pl.exceptions.PanicException):
-        df = pl.DataFrame(df.to_dicts() + dicts, infer_schema_length=len(df) + len(dicts))
-    return df
+hashtag_name = 'romania'
 
 
-async def main():
+async def main(flush_every=500):
     seedlist_df = pl.DataFrame()
     for filename in os.listdir('./data'):
         if filename.endswith('_collection.csv'):
@@ -29,15 +26,26 @@ async def main():
 
     seedlist_df = seedlist_df.unique('Tiktok')
 
-    collection_videos = {}
+    collection_stores = {}
     for collection in seedlist_df['Collection'].unique():
-        df_path = f'./data/{collection.lower()}_videos.parquet.zstd'
-        if os.path.exists(df_path):
-            df = pl.read_parquet(df_path)
-        else:
-            df = pl.DataFrame()
-        collection_videos[collection] = df
-
+        collection_stores[collection] = VideoStore(f'./data/{collection.lower()}_videos')
+
+    watermarks = AuthorWatermarks('./data/author_watermarks.sqlite')
+    if len(watermarks) == 0:
+        # first run, read the collections once rather than once per author
+        for store in collection_stores.values():
+            watermarks.seed(store.load(columns=['id', 'createTime', 'author', 'isPinnedItem']))
+
+    # videos are held per collection and written together, so only collections that changed get a fragment
+    collection_buffers = collections.defaultdict(list)
+    def flush():
+        for collection, videos in collection_buffers.items():
+            if len(videos) > 0:
+                collection_stores[collection].upsert(videos)
+        collection_buffers.clear()
+        watermarks.commit()
+
+    fetcher = InfoFetcher(USER_VIDEO_FIELDS)
     pbar = tqdm(total=len(seedlist_df))
     async with PyTok(manual_captcha_solves=True, logging_level=logging.DEBUG) as api:
         for author in seedlist_df.to_dicts():
@@ -50,34 +58,29 @@ async def main():
                 # if user_info['followerCount'] < 10000:
                 #     continue
 
-                collection_video_df = collection_videos[author['Collection']]
-                if 'isPinnedItem' in collection_video_df.columns:
-                    author_video_df = collection_video_df.filter((pl.col('author').struct.field('uniqueId') == handle) & (pl.col('isPinnedItem').is_null()))
-                else:
-                    author_video_df = collection_video_df.filter(pl.col('author').struct.field('uniqueId') == handle)
-                if len(author_video_df) > 0:
-                    limit_date = author_video_df.with_columns(pl.from_epoch(pl.col('createTime')))['createTime'].max()
-                else:
-                    limit_date = datetime.datetime(2022, 1, 1)
+                limit_date = watermarks.limit_date(handle)
 
                 videos = []
                 async for video in user.videos(count=1000):
-                    video_info = await video.info()
+                    video_info = await fetcher.info(video)
                     create_date = datetime.datetime.fromtimestamp(video_info['createTime'])
                     if (not video_info.get('isPinnedItem', False)) and create_date < limit_date:
                         break
                     videos.append(video_info)
 
-                if len(videos) == 0:
-                    continue
-
-                collection_videos[author['Collection']] = concat(collection_video_df, videos)
-
-                for collection, df in collection_videos.items():
-                    df.write_parquet(os.path.join(f'./data/{collection.lower()}_videos.parquet.zstd'), compression='zstd')
+                collection_buffers[author['Collection']].extend(videos)
+                watermarks.update(handle, videos)
+                if sum(len(videos) for videos in collection_buffers.values()) >= flush_every:
+                    flush()
             except (NotAvailableException, TimeoutException, NoContentException) as ex:
                 print(f"Exception when fetching user: {author['Tiktok']}, exception: {ex}")
 
+    flush()
+    fetcher.report('User videos')
+    watermarks.close()
+    for store in collection_stores.values():
+        store.close()
+
             
 
 if __name__ == "__main__":
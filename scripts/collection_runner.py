@@ -0,0 +1,137 @@
+import asyncio
+import collections
+import datetime
+import time
+
+import polars as pl
+
+from video_store import VideoStore
+
+class Source:
+    """Something to collect videos from, fetch(api, known) returns the list of video dicts"""
+    def __init__(self, name, store_path, fetch):
+        self.name = name
+        self.store_path = store_path
+        self.fetch = fetch
+
+class KnownRun:
+    """Tells a paginated listing to stop once stop_after ids in a row are already known.
+
+    Listings come back roughly newest first, so on a refresh a long run of videos already in the
+    store means the rest of the pages are too. With stop_after=None nothing is skipped.
+    """
+    def __init__(self, known_ids, stop_after=None):
+        self.known_ids = known_ids
+        self.stop_after = stop_after
+        self.run = 0
+        self.stopped = False
+
+    def stop(self, video_id):
+        if self.stop_after is None:
+            return False
+        self.run = self.run + 1 if str(video_id) in self.known_ids else 0
+        self.stopped = self.run >= self.stop_after
+        return self.stopped
+
+class SourceStats:
+    def __init__(self):
+        self.num_videos = 0
+        self.num_new = 0
+        self.num_failures = 0
+        self.num_stopped = 0
+        self.elapsed = 0
+
+class CollectionRunner:
+    """Collects from many sources at once over a bounded pool of sessions.
+
+    Each of num_sessions workers opens its own session from api_factory and takes sources from a
+    shared queue, so a full refresh takes about the slowest session's share of the pagination
+    rather than the sum of it. Fetched videos go through a queue to a single writer task, which
+    is the only thing writing to the stores. A source that fails is put back for another session
+    until it has been tried max_attempts times. With stop_after set, each source stops paginating
+    after that many consecutive videos already in its store.
+    """
+    def __init__(self, sources, api_factory, num_sessions=4, max_attempts=2, stop_after=None):
+        self.sources = sources
+        self.api_factory = api_factory
+        self.num_sessions = num_sessions
+        self.max_attempts = max_attempts
+        self.stop_after = stop_after
+        self.stats = collections.defaultdict(SourceStats)
+        self.stores = {}
+        self.fetchers = {}
+
+    async def run(self):
+        self.pending = asyncio.Queue()
+        for source in self.sources:
+            self.pending.put_nowait((source, 1))
+        self.results = asyncio.Queue(maxsize=2 * self.num_sessions)
+
+        start = time.monotonic()
+        writer = asyncio.create_task(self._write())
+        try:
+            await asyncio.gather(*[self._worker(session_id) for session_id in range(min(self.num_sessions, len(self.sources)))])
+        finally:
+            await self.results.put(None)
+            await writer
+            for store in self.stores.values():
+                store.close()
+
+        elapsed = time.monotonic() - start
+        for source in self.sources:
+            stats = self.stats[source.name]
+            stopped = ', stopped at known videos' if stats.num_stopped > 0 else ''
+            print(f"{source.name}: {stats.num_videos} videos, {stats.num_new} new, {stats.num_failures} failures, {stats.elapsed:.1f}s{stopped}")
+        # sessions that hydrate videos through an InfoFetcher report how many info() calls it saved
+        for session_id, fetcher in sorted(self.fetchers.items()):
+            fetcher.report(f"Session {session_id}")
+        total_fetch = sum(stats.elapsed for stats in self.stats.values())
+        print(f"Collected {len(self.sources)} sources in {elapsed:.1f}s, {total_fetch:.1f}s of fetching")
+
+    async def _worker(self, session_id):
+        async with self.api_factory() as api:
+            if getattr(api, 'fetcher', None) is not None:
+                self.fetchers[session_id] = api.fetcher
+            while not self.pending.empty():
+                source, attempt = self.pending.get_nowait()
+                stats = self.stats[source.name]
+                start = time.monotonic()
+                try:
+                    known_ids = set()
+                    if self.stop_after is not None:
+                        known_ids = (await asyncio.to_thread(self._store, source)).ids
+                    known = KnownRun(known_ids, self.stop_after)
+                    videos = await source.fetch(api, known)
+                    stats.elapsed += time.monotonic() - start
+                    stats.num_stopped += int(known.stopped)
+                    await self.results.put((source, videos))
+                except Exception as e:
+                    stats.elapsed += time.monotonic() - start
+                    stats.num_failures += 1
+                    print(f"Error fetching {source.name} in session {session_id}: {e}")
+                    if attempt < self.max_attempts:
+                        self.pending.put_nowait((source, attempt + 1))
+
+    async def _write(self):
+        while (result := await self.results.get()) is not None:
+            source, videos = result
+            stats = self.stats[source.name]
+            stats.num_videos += len(videos)
+            if len(videos) == 0:
+                continue
+            try:
+                # opening a store reads its ids, so the whole save runs off the event loop
+                stats.num_new += await asyncio.to_thread(self._save, source, videos)
+            except Exception as e:
+                stats.num_failures += 1
+                print(f"Error saving {source.name}: {e}")
+
+    def _store(self, source):
+        if source.store_path not in self.stores:
+            self.stores[source.store_path] = VideoStore(source.store_path)
+        return self.stores[source.store_path]
+
+    def _save(self, source, videos):
+        df = pl.DataFrame(videos)
+        df = df.with_columns(pl.lit(datetime.datetime.today()).alias('scrape_date'))
+        return self._store(source).upsert(df)
@@ -0,0 +1,120 @@
+import datetime
+import os
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from keywords import KeywordTagger
+from utils import conform_expr, unify_schemas
+
+def is_video_file(filename):
+    return filename.endswith('.parquet.zstd') and ('election_videos' in filename or 'hashtag_' in filename or '_videos' in filename)
+
+def is_hashtag_file(filename):
+    return filename.endswith('.parquet.zstd') and filename.startswith('hashtag_')
+
+def is_fetched_election_file(filename):
+    return filename == 'fetched_election_videos.parquet.zstd'
+
+def fragment_files(dir_path):
+    return sorted(os.path.join(dir_path, f) for f in os.listdir(dir_path) if f.endswith('.parquet.zstd'))
+
+def corpus_files(data_dir='./data', match=is_video_file):
+    paths = []
+    for filename in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, filename)
+        if os.path.isdir(path):
+            # video stores are directories of fragments named like the file they replace
+            if match(f'{filename}.parquet.zstd'):
+                paths.extend(fragment_files(path))
+        elif match(filename):
+            paths.append(path)
+    return paths
+
+def _to_epoch(date):
+    if isinstance(date, datetime.datetime):
+        return int(date.timestamp())
+    return int(datetime.datetime.combine(date, datetime.time()).timestamp())
+
+def scan_files(paths, columns=None):
+    """Build a single lazy frame over parquet files whose schemas may have drifted.
+
+    Files are grouped by schema so each group is one multi-file scan_parquet, and only groups whose
+    projected schema differs from the unified one get a cast.
+    """
+    if len(paths) == 0:
+        return pl.LazyFrame()
+
+    # reading the footers is cheap compared to the files themselves
+    file_schemas = {}
+    for path in paths:
+        try:
+            file_schemas[path] = pq.read_schema(path).remove_metadata()
+        except Exception as ex:
+            print(f"File: {path}, ex: {ex}")
+
+    # grouped on the full file schema, a multi-file scan takes its schema from the first file and
+    # fails on any later file with a column it does not have
+    groups = {}
+    for path, schema in file_schemas.items():
+        groups.setdefault(schema, []).append(path)
+
+    # each group is scanned whole and then projected onto the requested columns
+    groups = [
+        (schema if columns is None else pa.schema([schema.field(c) for c in columns if c in schema.names]), group_paths)
+        for schema, group_paths in groups.items()
+    ]
+    groups = [(schema, group_paths) for schema, group_paths in groups if len(schema) > 0]
+
+    # files whose types cannot be reconciled with the rest are skipped, like unreadable ones
+    target = pa.schema([])
+    unified = []
+    for schema, group_paths in groups:
+        try:
+            target = unify_schemas([target, schema])
+        except pl.exceptions.SchemaError as ex:
+            for path in group_paths:
+                print(f"File: {path}, ex: {ex}")
+            continue
+        unified.append((schema, group_paths))
+    groups = unified
+    if len(groups) == 0:
+        return pl.LazyFrame()
+
+    target = pl.from_arrow(target.empty_table()).schema
+
+    frames = []
+    for schema, group_paths in groups:
+        lf = pl.scan_parquet(group_paths).select(list(schema.names))
+        source = lf.collect_schema()
+        lf = lf.select([
+            conform_expr(pl.col(name), source[name], dtype).alias(name) if name in source else pl.lit(None, dtype=dtype).alias(name)
+            for name, dtype in target.items()
+        ])
+        frames.append(lf)
+
+    return pl.concat(frames, how='vertical')
+
+def scan_corpus(data_dir='./data', match=is_video_file, columns=None, keywords=None, start_date=None, end_date=None, unique_on='id'):
+    """Build a single lazy frame over every matching parquet file or video store in data_dir.
+
+    Column selection, the keyword filter on desc and hashtags and the createTime range are all pushed down into
+    the scans before deduplicating.
+    """
+    lf = scan_files(corpus_files(data_dir, match=match), columns=columns)
+    if len(lf.collect_schema()) == 0:
+        return lf
+
+    if keywords is not None:
+        lf = lf.filter(KeywordTagger(keywords).filter(lf.collect_schema()))
+    if start_date is not None:
+        lf = lf.filter(pl.col('createTime').cast(pl.Int64) >= _to_epoch(start_date))
+    if end_date is not None:
+        lf = lf.filter(pl.col('createTime').cast(pl.Int64) < _to_epoch(end_date))
+    if unique_on is not None:
+        lf = lf.unique(unique_on)
+    return lf
+
+def load_corpus(*args, **kwargs):
+    return scan_corpus(*args, **kwargs).collect(engine='streaming')
@@ -0,0 +1,134 @@
+import asyncio
+import collections
+import datetime
+import time
+
+class RateLimiter:
+    def __init__(self, delay):
+        self.delay = delay
+        self.last = None
+
+    async def wait(self):
+        if self.last is not None:
+            remaining = self.last + self.delay - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        self.last = time.monotonic()
+
+async def fetch_related(api, item, limiter):
+    author_id = (item.get('author') or {}).get('uniqueId')
+    video = api.video(username=author_id, id=item['id'])
+
+    await limiter.wait()
+    video_info = await video.info()
+    video_info['scrape_date'] = datetime.datetime.today()
+
+    await limiter.wait()
+    related_videos = []
+    async for related_info in video.related_videos():
+        related_info['scrape_date'] = datetime.datetime.today()
+        related_videos.append(related_info)
+
+    if len(related_videos) == 0:
+        raise Exception("No related videos found")
+    return video_info, related_videos
+
+class RelatedCrawler:
+    """Runs num_sessions browser sessions as asyncio tasks pulling from one shared frontier.
+
+    api_factory is called once per session and must return an async context manager with the
+    PyTok video interface, so a fake backend can stand in for the browser. Every session is rate
+    limited on its own, max_requests caps requests across all sessions, and results go through a
+    queue to a single aggregator that calls on_result(item, depth, video_info, related_videos).
+    on_failure(item, depth) is called for videos that could not be fetched.
+    """
+    def __init__(self, frontier, api_factory, on_result, on_failure=None, num_sessions=4, request_delay=1, max_requests=None):
+        self.frontier = frontier
+        self.api_factory = api_factory
+        self.on_result = on_result
+        self.on_failure = on_failure
+        self.num_sessions = num_sessions
+        self.request_delay = request_delay
+        self.max_requests = max_requests
+
+        self.num_requests = 0
+        self.session_counts = collections.Counter()
+        self.session_failures = collections.Counter()
+
+    async def run(self):
+        # counts videos popped but not yet aggregated, whose related videos may still refill the frontier
+        self.in_flight = 0
+        self.changed = asyncio.Condition()
+        self.results = asyncio.Queue(maxsize=2 * self.num_sessions)
+
+        start = time.monotonic()
+        aggregator = asyncio.create_task(self._aggregate())
+        workers = [asyncio.create_task(self._worker(session_id)) for session_id in range(self.num_sessions)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            # a session that fails to open would otherwise leave the others waiting on it
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        finally:
+            await self.results.put(None)
+            await aggregator
+
+        elapsed = time.monotonic() - start
+        for session_id in range(self.num_sessions):
+            print(f"Session {session_id}: {self.session_counts[session_id]} videos, {self.session_failures[session_id]} failures, {self.session_counts[session_id] / elapsed:.2f} videos/s")
+        print(f"Total requests: {self.num_requests}, elapsed: {elapsed:.1f}s")
+
+    def _budget_left(self):
+        return self.max_requests is None or self.num_requests < self.max_requests
+
+    async def _next(self):
+        async with self.changed:
+            while True:
+                if not self._budget_left():
+                    return None
+                if len(self.frontier) > 0:
+                    self.in_flight += 1
+                    return self.frontier.pop()
+                if self.in_flight == 0:
+                    return None
+                await self.changed.wait()
+
+    async def _done(self):
+        async with self.changed:
+            self.in_flight -= 1
+            self.changed.notify_all()
+
+    async def _worker(self, session_id):
+        limiter = RateLimiter(self.request_delay)
+        async with self.api_factory() as api:
+            while (entry := await self._next()) is not None:
+                item, depth = entry
+                try:
+                    # two requests per video, info and related
+                    self.num_requests += 2
+                    video_info, related_videos = await fetch_related(api, item, limiter)
+                    self.session_counts[session_id] += 1
+                    await self.results.put((item, depth, video_info, related_videos))
+                except Exception as e:
+                    print(e)
+                    self.session_failures[session_id] += 1
+                    try:
+                        if self.on_failure is not None:
+                            self.on_failure(item, depth)
+                    except Exception as e:
+                        print(e)
+                    finally:
+                        # without this the other sessions wait on in_flight forever
+                        await self._done()
+
+    async def _aggregate(self):
+        while (result := await self.results.get()) is not None:
+            try:
+                self.on_result(*result)
+            except Exception as e:
+                print(e)
+            finally:
+                await self._done()
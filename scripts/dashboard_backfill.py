@@ -0,0 +1,178 @@
+import concurrent.futures
+import datetime
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import polars as pl
+import requests
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class WindowLog:
+    """SQLite record of the date windows a backfill has finished, so a rerun only fetches the rest"""
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS windows ('
+            'start TEXT PRIMARY KEY, end TEXT, num_videos INTEGER, completed_at TEXT)'
+        )
+        self.conn.commit()
+
+    def completed(self):
+        return {row[0] for row in self.conn.execute('SELECT start FROM windows')}
+
+    def record(self, start, end, num_videos):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO windows (start, end, num_videos, completed_at) VALUES (?, ?, ?, ?)',
+            (start.isoformat(), end.isoformat(), num_videos, datetime.datetime.now().isoformat())
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def date_windows(start, end, window):
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start += window
+    return windows
+
+def response_videos(data):
+    # the dashboard answers an empty window with null rather than an empty list
+    if data is None:
+        return []
+    if isinstance(data, dict):
+        data = data.get('data') or []
+    if not isinstance(data, list):
+        raise ValueError(f"Unexpected dashboard response of type {type(data).__name__}")
+    return data
+
+class DashboardBackfill:
+    """Fetches the dashboard API over date windows with a pool of keep-alive sessions.
+
+    Each worker thread holds its own requests session, so connections are reused across windows,
+    and at most 2 * num_workers windows are in flight. Failed requests are retried with jittered
+    exponential backoff, honouring Retry-After. Every window is written to its own parquet file in
+    out_dir as soon as it arrives and then recorded in the window log, so an interrupted backfill
+    resumes from the windows it has not finished.
+    """
+    def __init__(self, endpoint, token, out_dir, state_path=None, window=datetime.timedelta(days=1), num_workers=4,
+                 max_retries=5, base_delay=1, max_delay=60, timeout=120):
+        self.endpoint = endpoint
+        self.token = token
+        self.out_dir = out_dir
+        self.window = window
+        self.num_workers = num_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.log = WindowLog(state_path or os.path.join(self.out_dir, 'windows.sqlite'))
+        self.local = threading.local()
+        self.sessions = []
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.num_retries = 0
+        self.num_failed = 0
+
+    def _session(self):
+        if not hasattr(self.local, 'session'):
+            session = requests.Session()
+            session.headers.update({"Authorization": f"Bearer {self.token}"})
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return self.local.session
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), self.max_delay)
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1)
+
+    def fetch_window(self, start, end):
+        params = {
+            "platform": 'tiktok',
+            "query": '*',
+            "from_date": start.strftime("%d-%m-%Y"),
+            "to_date": end.strftime("%d-%m-%Y"),
+        }
+        session = self._session()
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                with self.lock:
+                    self.num_requests += 1
+                response = session.post(self.endpoint, json=params, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response_videos(response.json())
+                logger.info(f"Dashboard returned {response.status_code} for {start} to {end}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.info(f"Request failed for tiktok from {start} to {end}: {e}")
+            if attempt < self.max_retries:
+                with self.lock:
+                    self.num_retries += 1
+                time.sleep(self._backoff(attempt, response))
+        raise requests.RequestException(f"Gave up on {start} to {end} after {self.max_retries + 1} attempts")
+
+    def window_path(self, start, end):
+        return os.path.join(self.out_dir, f'{start.isoformat()}_{end.isoformat()}.parquet.zstd')
+
+    def load_window(self, start, end):
+        """Videos saved for a finished window, windows with no videos have no file"""
+        file_path = self.window_path(start, end)
+        return pl.read_parquet(file_path).to_dicts() if os.path.exists(file_path) else []
+
+    def _write(self, start, end, videos):
+        if len(videos) == 0:
+            return None
+        file_path = self.window_path(start, end)
+        tmp_path = os.path.join(self.out_dir, f'.{os.path.basename(file_path)}.tmp')
+        pl.DataFrame(videos, infer_schema_length=None).write_parquet(tmp_path, compression='zstd')
+        os.replace(tmp_path, file_path)
+        return file_path
+
+    def run(self, start, end):
+        """Fetch every unfinished window in [start, end), yielding (start, end, videos) as each one lands"""
+        completed = self.log.completed()
+        windows = [w for w in date_windows(start, end, self.window) if w[0].isoformat() not in completed]
+        logger.info(f"Backfilling {len(windows)} windows, {len(completed)} already done")
+
+        windows = iter(windows)
+        pending = {}
+        with concurrent.futures.ThreadPoolExecutor(self.num_workers) as executor:
+            while True:
+                while len(pending) < 2 * self.num_workers and (w := next(windows, None)) is not None:
+                    pending[executor.submit(self.fetch_window, *w)] = w
+                if len(pending) == 0:
+                    break
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    window_start, window_end = pending.pop(future)
+                    try:
+                        videos = future.result()
+                        self._write(window_start, window_end, videos)
+                    except Exception as e:
+                        # left out of the log, so the next run tries the window again
+                        self.num_failed += 1
+                        logger.error(f"Failed window {window_start} to {window_end}: {e}")
+                        continue
+                    self.log.record(window_start, window_end, len(videos))
+                    yield window_start, window_end, videos
+
+        logger.info(f"{self.num_requests} requests, {self.num_retries} retries, {self.num_failed} failed windows")
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+        self.log.close()
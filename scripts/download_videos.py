@@ -3,57 +3,50 @@ import datetime
 import json
 import logging
 import os
-import re
+import time
 import traceback
 
-import boto3
-import dotenv
-import hydra
-import requests
 import tqdm
 from pytok.tiktok import PyTok
 
 import polars as pl
 
+from dashboard_backfill import DashboardBackfill, date_windows
+from media_manifest import MediaManifest
+from media_sink import LocalSink
+from utils import concat_all
+from video_info import DOWNLOAD_FIELDS, InfoFetcher, play_url_fresh
+from video_store import VideoStore
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 
-def get_video_data(token, endpoint, start_date_str, end_date_str):
-    
+def fetch_platform_data_daily(config, token, out_dir='./data/dashboard', num_workers=4):
+    """Yield every dashboard video since 2022, fetched one day at a time.
+
+    Days saved to out_dir by earlier runs are read back from their files rather than fetched again,
+    so a rerun only requests the days it has not finished but still yields the full history.
+    """
     if token is None:
         logger.info("Failed to retrieve token.")
-        return None
-
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {
-        "platform": 'tiktok',
-        "query": '*',
-        "from_date": datetime.datetime.strptime(start_date_str, "%Y-%m-%d").strftime("%d-%m-%Y"),
-        "to_date": datetime.datetime.strptime(end_date_str, "%Y-%m-%d").strftime("%d-%m-%Y")
-    }
-
-    try:
-        with requests.session() as session:
-            response = session.post(endpoint, json=params, headers=headers)
-            response.raise_for_status()
-            return response.json()
-    except requests.RequestException as e:
-        logger.info(f"Request failed for tiktok from {start_date_str} to {end_date_str}: {e}")
-        return None
-    
-def fetch_platform_data_daily(config, token):
-    # Go back the number of days needed to make the hour look-back period
-    current_datetime = datetime.date(2022, 1, 1)
-    final_datetime = datetime.date.today()
+        return
     endpoint = config["meo-api"]["base-url"] + "/dashboard"
-    while current_datetime < final_datetime:
-        
-        day_str = current_datetime.strftime("%Y-%m-%d")
-        day_str_plus1 = (current_datetime + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-        #logger.info(f"Processing data for {day_str}")
-        data = get_video_data(token, endpoint, day_str, day_str_plus1)
-        for video_data in data:
-            yield video_data
-        current_datetime += datetime.timedelta(days=1)  # Move to the next day
+    start, end = datetime.date(2022, 1, 1), datetime.date.today()
+    backfill = DashboardBackfill(endpoint, token, out_dir, num_workers=num_workers)
+    try:
+        completed = backfill.log.completed()
+        for window_start, window_end in date_windows(start, end, backfill.window):
+            if window_start.isoformat() in completed:
+                yield from backfill.load_window(window_start, window_end)
+        for _, _, videos in backfill.run(start, end):
+            yield from videos
+    finally:
+        backfill.close()
 
 def get_headers():
     headers = {
@@ -85,33 +78,52 @@ class NotFoundException(Exception):
     pass
 
 class ProcessVideo:
+    """Incrementally finds the webapp.video-detail JSON in a streamed TikTok page.
+
+    Each chunk is only searched together with a marker-length overlap from the previous one, and
+    the JSON is accumulated in a bytearray, so processing a page is linear in its size.
+    """
     def __init__(self, r):
         self.r = r
         if r.status_code != 200:
             raise InvalidResponseException(
                 r, f"TikTok returned a {r.status_code} status code."
             )
-        self.text = ""
+        self.buffer = bytearray()
         self.start = -1
-        self.json_start = '"webapp.video-detail":'
+        self.json_start = b'"webapp.video-detail":'
         self.json_start_len = len(self.json_start)
         self.end = -1
-        self.json_end = ',"webapp.a-b":'
-    
+        self.json_end = b',"webapp.a-b":'
+        self.json_end_len = len(self.json_end)
+
+    @property
+    def text(self):
+        return self.buffer.decode('utf-8', errors='replace')
+
     def process_chunk(self, text_chunk):
-        self.text += text_chunk
-        if len(self.text) < self.json_start_len:
-            return 'continue'
+        if isinstance(text_chunk, str):
+            text_chunk = text_chunk.encode('utf-8')
+
         if self.start == -1:
-            self.start = self.text.find(self.json_start)
-            if self.start != -1:
-                self.text = self.text[self.start + self.json_start_len:]
-                self.start = 0
-        if self.start != -1:
-            self.end = self.text.find(self.json_end)
-            if self.end != -1:
-                self.text = self.text[:self.end]
-                return 'break'
+            # keep just enough of the previous chunks to catch a marker split across chunks
+            search_from = max(0, len(self.buffer) - self.json_start_len + 1)
+            self.buffer = self.buffer[search_from:]
+            self.buffer += text_chunk
+            start = self.buffer.find(self.json_start)
+            if start == -1:
+                return 'continue'
+            del self.buffer[:start + self.json_start_len]
+            self.start = 0
+            search_from = 0
+        else:
+            search_from = max(0, len(self.buffer) - self.json_end_len + 1)
+            self.buffer += text_chunk
+
+        self.end = self.buffer.find(self.json_end, search_from)
+        if self.end != -1:
+            del self.buffer[self.end:]
+            return 'break'
         return 'continue'
             
     def process_response(self):
@@ -120,7 +132,7 @@ class ProcessVideo:
                 "Could not find normal JSON section in returned HTML.",
                 json.dumps({'text': self.text, 'encoding': self.r.encoding}),
             )
-        video_detail = json.loads(self.text)
+        video_detail = json_loads(bytes(self.buffer))
         if video_detail.get("statusCode", 0) != 0: # assume 0 if not present
             # TODO retry when status indicates server error
             return video_detail
@@ -131,109 +143,237 @@ class ProcessVideo:
             )
         return video_info
 
-async def pytok_bytes(api, videos, logger, headless, request_delay):
-    video_bytes = {}
+async def stream_video_bytes(video):
+    try:
+        result = await video.bytes(stream=True)
+    except TypeError:
+        # this version of the api can only return the whole video
+        result = await video.bytes()
+    if result is None:
+        return
+    if isinstance(result, (bytes, bytearray)):
+        yield result
+    else:
+        async for chunk in result:
+            yield chunk
+
+async def write_video_bytes(video, writer):
+    async for chunk in stream_video_bytes(video):
+        await asyncio.to_thread(writer.write, chunk)
+
+async def pytok_bytes(api, videos, logger, headless, request_delay, sink, fetcher=None):
+    """Stream each video into the sink as it arrives, returning the size and checksum of each one saved.
+
+    Videos whose stored payload still has a live play address are downloaded without info().
+    """
+    fetcher = fetcher or InfoFetcher(DOWNLOAD_FIELDS, check=play_url_fresh)
+    saved = {}
     for video_data in videos:
+        writer = None
         try:
             video_id = video_data['id']
             video = api.video(id=video_id)
-            video_info = await video.info()
-            video_video_bytes = await video.bytes()
-            if video_video_bytes is not None:
-                video_bytes[video_data['id']] = video_video_bytes
+            video_info = await fetcher.info(video, video_data)
+            from_listing = video_info is video_data
+            if from_listing:
+                video.as_dict = video_data
+            writer = sink.open(f"{video_id}.mp4")
+            try:
+                await write_video_bytes(video, writer)
+            except Exception:
+                if not from_listing or writer.size > 0:
+                    raise
+            if writer.size == 0 and from_listing:
+                # the stored play address was refused, look the video up and try once more
+                await fetcher.full_info(video)
+                await write_video_bytes(video, writer)
+            if writer.size == 0:
+                writer.abort()
+                continue
+            size, checksum = await asyncio.to_thread(writer.commit)
+            saved[video_id] = {'size': size, 'sha256': checksum, 'location': sink.location(f"{video_id}.mp4")}
         except Exception as ex:
+            if writer is not None:
+                writer.abort()
             logger.error(f"Error getting video bytes for {video_data['id']}: {ex}")
             continue
 
-    return video_bytes
+    return saved
 
 class VideoBytesScraper:
-    def __init__(self, logger, data_dir_path, headless=True, request_delay=3):
+    def __init__(self, logger, sink, manifest=None, headless=True, request_delay=3):
         self.logger = logger
+        self.fetcher = InfoFetcher(DOWNLOAD_FIELDS, check=play_url_fresh)
         self.headless = headless
-        self.data_dir_path = data_dir_path
+        self.sink = sink
+        self.manifest = manifest
         self.request_delay = request_delay
 
     async def get_video_bytes_batch(self, api, videos):
-        
+        saved = {}
         try:
             # if self.lib == 'tiktokapi':
             #     video_bytes = await tiktokapi_bytes(videos, self.logger, self.request_delay)
             # elif self.lib == 'pytok':
-            video_bytes = await pytok_bytes(api, videos, self.logger, self.headless, self.request_delay)
+            saved = await pytok_bytes(api, videos, self.logger, self.headless, self.request_delay, self.sink, fetcher=self.fetcher)
+
+            if self.manifest is not None:
+                for video_data in videos:
+                    if video_data['id'] in saved:
+                        info = saved[video_data['id']]
+                        duration = (video_data.get('video') or {}).get('duration')
+                        self.manifest.record(video_data['id'], info['size'], sha256=info['sha256'], location=info['location'], duration=duration)
 
         except Exception as e:
             self.logger.error(f"Error getting batch: {e}")
             self.logger.error(f"Trackback: {traceback.format_exc()}")
 
-        return video_bytes
+        return saved
+
+class DownloadSession:
+    def __init__(self, session_id, api_factory, base_delay, max_delay):
+        self.session_id = session_id
+        self.api_factory = api_factory
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = base_delay
+        self.context = None
+        self.api = None
+
+        self.num_requests = 0
+        self.num_consecutive_errors = 0
+        self.num_videos = 0
+        self.num_failures = 0
+        self.num_bytes = 0
+        self.num_recycles = 0
+        self.elapsed = 0
+
+    async def open(self):
+        self.context = self.api_factory()
+        self.api = await self.context.__aenter__()
+        self.num_requests = 0
+        self.num_consecutive_errors = 0
+        self.delay = self.base_delay
+
+    async def close(self):
+        if self.context is not None:
+            await self.context.__aexit__(None, None, None)
+            self.context = None
+
+    async def recycle(self):
+        await self.close()
+        await self.open()
+        self.num_recycles += 1
+
+    def succeeded(self, num_bytes):
+        self.num_videos += 1
+        self.num_bytes += num_bytes
+        self.num_consecutive_errors = 0
+        self.delay = max(self.base_delay, self.delay / 2)
+
+    def failed(self):
+        self.num_failures += 1
+        self.num_consecutive_errors += 1
+        self.delay = min(self.max_delay, self.delay * 2)
+
+class BrowserPool:
+    """Downloads video bytes with a pool of long lived browser sessions.
+
+    Each session downloads one video at a time, so concurrency is bounded by num_sessions. The
+    delay after each request halves on success and doubles on failure, and a session is only
+    relaunched after max_session_errors consecutive failures or max_session_requests requests.
+    """
+    def __init__(self, api_factory, num_sessions=4, max_session_requests=200, max_session_errors=3, base_delay=1, max_delay=60):
+        self.api_factory = api_factory
+        self.num_sessions = num_sessions
+        self.max_session_requests = max_session_requests
+        self.max_session_errors = max_session_errors
+        self.sessions = [DownloadSession(i, api_factory, base_delay, max_delay) for i in range(num_sessions)]
+
+    async def download(self, scraper, videos):
+        queue = asyncio.Queue()
+        for video_data in videos:
+            queue.put_nowait(video_data)
+
+        pbar = tqdm.tqdm(total=len(videos), desc="Getting video bytes")
+        await asyncio.gather(*[self._worker(session, scraper, queue, pbar) for session in self.sessions])
+        pbar.close()
+        self.report()
+
+    async def _worker(self, session, scraper, queue, pbar):
+        await session.open()
+        try:
+            while not queue.empty():
+                video_data = queue.get_nowait()
+                if session.num_consecutive_errors >= self.max_session_errors or session.num_requests >= self.max_session_requests:
+                    await session.recycle()
+
+                start = time.monotonic()
+                saved = await scraper.get_video_bytes_batch(session.api, [video_data])
+                session.num_requests += 1
+                if video_data['id'] in saved:
+                    session.succeeded(saved[video_data['id']]['size'])
+                else:
+                    session.failed()
+                session.elapsed += time.monotonic() - start
+                pbar.update(1)
+
+                # sleep to avoid rate limiting
+                await asyncio.sleep(session.delay)
+        finally:
+            await session.close()
+
+    def report(self):
+        for session in self.sessions:
+            rate = session.num_videos / session.elapsed if session.elapsed > 0 else 0
+            logger.info(
+                f"Session {session.session_id}: {session.num_videos} videos, {session.num_failures} failures, "
+                f"{session.num_bytes / 1e6:.1f}MB, {rate:.2f} videos/s, {session.num_recycles} recycles"
+            )
 
-    def save_data(self, data):
-        video_bytes = data
-        for video_id, byte_data in video_bytes.items():
-            bytes_file = f"{video_id}.mp4"
-            bytes_file_path = os.path.join(self.data_dir_path, bytes_file)
-            with open(bytes_file_path, 'wb') as f:
-                f.write(byte_data)
-    
 
 async def get_tiktok_video_bytes():
     data_dir_path = './data/mp4s'
     os.makedirs(data_dir_path, exist_ok=True)
     headless = False
     request_delay = 1
-    batch_delay = 1
+    num_sessions = 4
+
+    manifest = MediaManifest('./data/mp4s_manifest.sqlite')
+    if len(manifest) == 0:
+        # first run, index whatever was downloaded before the manifest existed
+        manifest.reconcile_local(data_dir_path)
 
     scraper = VideoBytesScraper(
         logger, 
-        data_dir_path, 
+        LocalSink(data_dir_path), 
+        manifest=manifest,
         headless=headless,
         request_delay=request_delay
     )
 
-    saved_video_files = os.listdir(data_dir_path)
-    saved_video_df = pl.DataFrame({'filename': saved_video_files})
-    saved_video_df = saved_video_df.select(pl.col('filename').str.split('.').list.get(0).alias('id'))
-
     logger.info("Getting video df")
-    try:
-        dubois_df = pl.read_parquet('./data/dubois_videos.parquet.zstd')
-    except:
-        dubois_df = pl.read_parquet('./data/dubois_videos_backup.parquet.zstd')
-
-    try:
-        dark_df = pl.read_parquet('./data/dark_videos.parquet.zstd')
-    except:
-        dark_df = pl.read_parquet('./data/dark_videos_backup.parquet.zstd')
-
-    video_df = pl.concat([dubois_df, dark_df], how='diagonal_relaxed')
+    video_df = concat_all([
+        VideoStore('./data/dubois_videos').load(),
+        VideoStore('./data/dark_videos').load()
+    ])
 
-    video_df = video_df.join(saved_video_df, on='id', how='anti')
+    video_df = manifest.missing(video_df, on='id')
     video_df = video_df.filter(pl.col('video').struct.field('duration') > 0)
     # scrape video bytes
 
     # TODO to remove
     video_df = video_df.filter(pl.col('author').struct.field('uniqueId').is_in(['greenneighbour', 'thisthatandmoreeeee', 'couplecasualspodcast']))
 
-    batch_size = 20
-
     logger.info("Starting video bytes scrape")
-    pbar = tqdm.tqdm(desc="Getting video bytes")
-    for batch_i in range(0, len(video_df), batch_size):
-        async with PyTok(manual_captcha_solves=False, headless=headless, logging_level=logging.DEBUG) as api:
-            for video_data in video_df.slice(batch_i, batch_i + batch_size).to_dicts():
-                pbar.update(1)
-                try:
-                    data = await scraper.get_video_bytes_batch(api, [video_data])
-                    # waiting to ensure the data is saved before moving on
-                    scraper.save_data(data)
-                except Exception as ex:
-                    continue
-
-                # sleep to avoid rate limiting
-                await asyncio.sleep(batch_delay)
-
-    pbar.close()
+    pool = BrowserPool(
+        lambda: PyTok(manual_captcha_solves=False, headless=headless, logging_level=logging.DEBUG),
+        num_sessions=num_sessions,
+        base_delay=request_delay
+    )
+    await pool.download(scraper, video_df.to_dicts())
+    scraper.fetcher.report('Video bytes')
+    manifest.close()
 
 def main():
     asyncio.run(get_tiktok_video_bytes())
@@ -0,0 +1,75 @@
+import collections
+import heapq
+import itertools
+
+from keywords import KeywordTagger
+
+def by_follower_count(item, depth):
+    author_stats = item.get('authorStats') or {}
+    return author_stats.get('followerCount') or 0
+
+def by_depth(item, depth):
+    # fewer related hops from a seed video first
+    return -depth
+
+PRIORITIES = {
+    'fifo': None,
+    'followers': by_follower_count,
+    'depth': by_depth,
+}
+
+class Frontier:
+    """Queue of videos still to fetch, with a set of every id ever enqueued or fetched.
+
+    Keyword filtering happens once, on push, with the same description and hashtag match as the
+    corpus filter, so nothing is rescanned as the crawl goes on. Without a priority function this
+    is a FIFO deque with O(1) push and pop, otherwise a heap ordered by priority(item, depth),
+    highest first, with O(log n) push and pop. If a checkpoint is given, pushes and pops are
+    recorded in it.
+    """
+    def __init__(self, keywords=None, priority=None, checkpoint=None):
+        self.tagger = KeywordTagger(keywords) if keywords is not None else None
+        self.priority = PRIORITIES.get(priority, priority) if isinstance(priority, str) or priority is None else priority
+        self.checkpoint = checkpoint
+        self.seen = set()
+        self.queue = collections.deque() if self.priority is None else []
+        # tie breaker so the heap never compares item dicts
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __contains__(self, video_id):
+        return str(video_id) in self.seen
+
+    def matches(self, item):
+        return self.tagger is None or self.tagger.item_matches(item)
+
+    def mark_seen(self, video_ids):
+        self.seen.update(str(video_id) for video_id in video_ids)
+
+    def push(self, item, depth=0):
+        """Enqueue item if it is new and matches the keywords, returning whether it was added"""
+        video_id = str(item['id'])
+        if video_id in self.seen or not self.matches(item):
+            return False
+        self.seen.add(video_id)
+        if self.checkpoint is not None:
+            self.checkpoint.record_push(item, depth)
+        self.enqueue(item, depth)
+        return True
+
+    def enqueue(self, item, depth):
+        if self.priority is None:
+            self.queue.append((item, depth))
+        else:
+            heapq.heappush(self.queue, (-self.priority(item, depth), next(self.counter), item, depth))
+
+    def pop(self):
+        if self.priority is None:
+            item, depth = self.queue.popleft()
+        else:
+            _, _, item, depth = heapq.heappop(self.queue)
+        if self.checkpoint is not None:
+            self.checkpoint.record_pop(item['id'])
+        return item, depth
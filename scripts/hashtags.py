@@ -0,0 +1,159 @@
+import datetime
+import os
+
+import numpy as np
+import polars as pl
+import scipy.sparse as sp
+
+from corpus import scan_corpus
+
+def hashtags_expr():
+    return pl.col('desc').str.to_lowercase().str.extract_all(r'#\w+')\
+        .list.eval(pl.element().str.strip_prefix('#'))\
+        .list.unique()\
+        .alias('hashtags')
+
+class HashtagMatrix:
+    """Sparse video by hashtag incidence matrix, built once and queried many times.
+
+    Rows are videos sorted by createTime, so a time window is a contiguous slice of rows, and
+    columns are hashtags in alphabetical order. Counts, co-occurrence, PMI and trends are all
+    sparse matrix products over it.
+    """
+    def __init__(self, matrix, hashtags, video_ids, create_times):
+        self.matrix = matrix.tocsr()
+        self.hashtags = np.asarray(hashtags)
+        self.video_ids = np.asarray(video_ids)
+        self.create_times = np.asarray(create_times)
+        self.index = {hashtag: i for i, hashtag in enumerate(self.hashtags)}
+        self._csc = None
+
+    @classmethod
+    def build(cls, df):
+        """Build from a frame of videos with id, createTime and desc, which may be lazy"""
+        df = df.select([pl.col('id').cast(pl.String), pl.col('createTime').cast(pl.Int64), hashtags_expr()])\
+            .sort('createTime')
+        if isinstance(df, pl.LazyFrame):
+            df = df.collect(engine='streaming')
+        df = df.with_row_index('row')
+        pairs_df = df.select(['row', 'hashtags']).explode('hashtags').drop_nulls('hashtags')
+        hashtags = pairs_df['hashtags'].unique().sort()
+        cols = pairs_df['hashtags'].cast(pl.Enum(hashtags)).to_physical().to_numpy()
+        rows = pairs_df['row'].to_numpy()
+        matrix = sp.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+            shape=(len(df), len(hashtags))
+        )
+        return cls(matrix, hashtags.to_numpy(), df['id'].to_numpy(), df['createTime'].to_numpy())
+
+    def save(self, dir_path):
+        os.makedirs(dir_path, exist_ok=True)
+        sp.save_npz(os.path.join(dir_path, 'matrix.npz'), self.matrix)
+        for name in ['hashtags', 'video_ids', 'create_times']:
+            np.save(os.path.join(dir_path, f'{name}.npy'), getattr(self, name).astype(str) if name != 'create_times' else self.create_times)
+
+    @classmethod
+    def load(cls, dir_path):
+        arrays = {name: np.load(os.path.join(dir_path, f'{name}.npy')) for name in ['hashtags', 'video_ids', 'create_times']}
+        return cls(sp.load_npz(os.path.join(dir_path, 'matrix.npz')), **arrays)
+
+    @property
+    def csc(self):
+        if self._csc is None:
+            self._csc = self.matrix.tocsc()
+        return self._csc
+
+    def rows(self, start=None, end=None):
+        """Rows of videos created in [start, end), as a cheap CSR slice"""
+        lower = 0 if start is None else np.searchsorted(self.create_times, _to_epoch(start), side='left')
+        upper = len(self.create_times) if end is None else np.searchsorted(self.create_times, _to_epoch(end), side='left')
+        return self.matrix[lower:upper]
+
+    def counts(self, start=None, end=None):
+        matrix = self.rows(start, end)
+        return pl.DataFrame({'hashtag': self.hashtags, 'count': np.asarray(matrix.sum(axis=0)).ravel()})\
+            .filter(pl.col('count') > 0)\
+            .sort('count', descending=True)
+
+    def related(self, hashtag, top_k=20):
+        """Hashtags most often used alongside hashtag"""
+        col = self.index[hashtag]
+        videos = self.csc[:, col].indices
+        counts = np.asarray(self.matrix[videos].sum(axis=0)).ravel()
+        counts[col] = 0
+        top = np.argsort(-counts)[:top_k]
+        top = top[counts[top] > 0]
+        return pl.DataFrame({'hashtag': self.hashtags[top], 'count': counts[top]})
+
+    def cooccurrence(self, min_count=10, start=None, end=None):
+        """Pairs of hashtags used together, with their counts and pointwise mutual information.
+
+        Hashtags used in fewer than min_count videos are dropped before the product, which keeps
+        X^T X small on large corpora.
+        """
+        matrix = self.rows(start, end)
+        num_videos = matrix.shape[0]
+        counts = np.asarray(matrix.sum(axis=0)).ravel()
+        keep = np.flatnonzero(counts >= min_count)
+        matrix = matrix[:, keep]
+        pair_counts = sp.triu(matrix.T @ matrix, k=1).tocoo()
+
+        count_a = counts[keep[pair_counts.row]]
+        count_b = counts[keep[pair_counts.col]]
+        pmi = np.log(pair_counts.data.astype(np.float64) * num_videos / (count_a.astype(np.float64) * count_b))
+        return pl.DataFrame({
+            'hashtag_a': self.hashtags[keep[pair_counts.row]],
+            'hashtag_b': self.hashtags[keep[pair_counts.col]],
+            'count': pair_counts.data,
+            'count_a': count_a,
+            'count_b': count_b,
+            'pmi': pmi,
+        }).sort('count', descending=True)
+
+    def window_counts(self, every=datetime.timedelta(days=1)):
+        """Hashtag counts per time window, as a windows by hashtags sparse matrix and the window starts"""
+        width = int(every.total_seconds())
+        windows = (self.create_times - self.create_times[0]) // width
+        num_windows = int(windows[-1]) + 1 if len(windows) > 0 else 0
+        # one product with a window by video indicator matrix instead of a slice per window
+        indicator = sp.csr_matrix(
+            (np.ones(len(windows), dtype=np.int32), (windows, np.arange(len(windows)))),
+            shape=(num_windows, len(windows))
+        )
+        starts = self.create_times[0] + np.arange(num_windows) * width if num_windows > 0 else np.empty(0, dtype=np.int64)
+        return indicator @ self.matrix, starts
+
+    def trending(self, every=datetime.timedelta(days=1), min_count=10, top_k=10):
+        """Hashtags with the largest rise in use from each window to the next"""
+        counts, starts = self.window_counts(every)
+        counts = counts.tocoo()
+        counts_df = pl.DataFrame({'window': counts.row.astype(np.int64), 'col': counts.col.astype(np.int64), 'count': counts.data})
+        previous_df = counts_df.select([pl.col('window') + 1, 'col', pl.col('count').alias('previous_count')])
+
+        df = counts_df.filter(pl.col('count') >= min_count)\
+            .join(previous_df, on=['window', 'col'], how='left')\
+            .with_columns(pl.col('previous_count').fill_null(0))\
+            .with_columns((pl.col('count') - pl.col('previous_count')).alias('delta'))\
+            .sort(['window', 'delta'], descending=[False, True])\
+            .group_by('window', maintain_order=True).head(top_k)
+        return df.with_columns([
+            pl.from_epoch(pl.Series('window_start', starts[df['window'].to_numpy()])),
+            pl.Series('hashtag', self.hashtags[df['col'].to_numpy()]),
+        ]).select(['window_start', 'hashtag', 'count', 'previous_count', 'delta'])
+
+def _to_epoch(time):
+    if isinstance(time, datetime.datetime):
+        return int(time.timestamp())
+    if isinstance(time, datetime.date):
+        return int(datetime.datetime.combine(time, datetime.time()).timestamp())
+    return int(time)
+
+def main():
+    matrix = HashtagMatrix.build(scan_corpus('./data', columns=['id', 'createTime', 'desc']))
+    matrix.save('./data/hashtag_matrix')
+    print(f"{matrix.matrix.shape[0]} videos, {matrix.matrix.shape[1]} hashtags, {matrix.matrix.nnz} uses")
+    print(matrix.cooccurrence().sort('pmi', descending=True).head(20))
+    print(matrix.trending(every=datetime.timedelta(days=7)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import polars as pl
+
+ELECTION_KEYWORDS = {
+    'romania-2024': ['lasconi', 'georgescu'],
+    'canada-2025': [
+        'canada', 'election', 'canadapoli', 'cdnpolitics', 'cdnpoli', 'elbowsup', 'canadaelection', '51ststate',
+        'poilievre', 'carney', 'jagmeet', 'bernier', 'blanchet',
+    ],
+}
+
+def election_keywords(*elections):
+    keywords = []
+    for election in elections or ELECTION_KEYWORDS.keys():
+        keywords += [k for k in ELECTION_KEYWORDS[election] if k not in keywords]
+    return keywords
+
+class KeywordTagger:
+    """Matches a set of keywords against descriptions and hashtags in a single pass.
+
+    Matching is done by polars' Aho-Corasick string search on the lowercased description joined
+    with the titles of the video's challenges, so the cost does not grow with the number of
+    keywords. Matches can come out as a list of keywords or as a bitmask with bit i for keywords[i].
+    """
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(k.lower() for k in keywords))
+        if len(self.keywords) > 63:
+            raise ValueError("At most 63 keywords fit in the keyword mask")
+
+    def bits(self, keywords):
+        mask = 0
+        for keyword in keywords:
+            mask |= 1 << self.keywords.index(keyword.lower())
+        return mask
+
+    def text(self, schema):
+        text = pl.col('desc').fill_null('')
+        if 'challenges' in schema and isinstance(schema['challenges'], pl.List):
+            hashtags = pl.col('challenges').list.eval(pl.element().struct.field('title')).list.join(' ').fill_null('')
+            text = pl.concat_str([text, hashtags], separator=' ')
+        return text.str.to_lowercase()
+
+    def item_text(self, item):
+        hashtags = [challenge.get('title') or '' for challenge in item.get('challenges') or []]
+        return ' '.join([item.get('desc') or ''] + hashtags).lower()
+
+    def item_matches(self, item):
+        """Whether a single video dict matches any keyword, the same test filter makes on a row"""
+        text = self.item_text(item)
+        return any(keyword in text for keyword in self.keywords)
+
+    def filter(self, schema):
+        """Expression that is true for videos matching any keyword"""
+        return self.text(schema).str.contains_any(self.keywords)
+
+    def matches(self, schema):
+        return self.text(schema).str.extract_many(self.keywords, overlapping=True).list.unique(maintain_order=True).alias('keywords')
+
+    def mask(self, schema):
+        bits = [1 << i for i in range(len(self.keywords))]
+        return self.matches(schema)\
+            .list.eval(pl.element().replace_strict(self.keywords, bits, return_dtype=pl.UInt64))\
+            .list.sum().fill_null(0).cast(pl.UInt64).alias('keyword_mask')
+
+    def mask_filter(self, keywords):
+        """Expression on a keyword_mask column matching any of keywords"""
+        return (pl.col('keyword_mask') & self.bits(keywords)) != 0
+
+    def tag(self, df):
+        schema = df.collect_schema()
+        return df.with_columns([self.matches(schema), self.mask(schema)])
@@ -0,0 +1,129 @@
+import datetime
+import hashlib
+import os
+import sqlite3
+import sys
+
+import polars as pl
+
+MANIFEST_SCHEMA = {
+    'video_id': pl.String,
+    'size': pl.Int64,
+    'sha256': pl.String,
+    'duration': pl.Float64,
+    'location': pl.String,
+}
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+class MediaManifest:
+    """SQLite index of downloaded media keyed by video id, so nobody has to list the media itself.
+
+    Downloads record each video as it is written. reconcile_local and reconcile_s3 bring the
+    manifest in line with what is actually stored, only writing entries that changed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS media ('
+            'video_id TEXT PRIMARY KEY, size INTEGER, sha256 TEXT, duration REAL, location TEXT, updated_at TEXT)'
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM media').fetchone()[0]
+
+    def __contains__(self, video_id):
+        return self.conn.execute('SELECT 1 FROM media WHERE video_id = ?', (str(video_id),)).fetchone() is not None
+
+    def record(self, video_id, size, sha256=None, location=None, duration=None, commit=True):
+        self.conn.execute(
+            'INSERT INTO media (video_id, size, sha256, duration, location, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (video_id) DO UPDATE SET size = excluded.size, sha256 = COALESCE(excluded.sha256, sha256), '
+            'duration = COALESCE(excluded.duration, duration), location = excluded.location, updated_at = excluded.updated_at',
+            (str(video_id), size, sha256, duration, location, datetime.datetime.now().isoformat())
+        )
+        if commit:
+            self.conn.commit()
+
+    def load(self, columns=None):
+        columns = columns or list(MANIFEST_SCHEMA.keys())
+        rows = self.conn.execute(f"SELECT {', '.join(columns)} FROM media").fetchall()
+        return pl.DataFrame(rows, schema={c: MANIFEST_SCHEMA[c] for c in columns}, orient='row')
+
+    def missing(self, df, on='id'):
+        """Rows of df whose videos are not in the manifest"""
+        ids = self.load(columns=['video_id']).rename({'video_id': on})
+        return df.join(ids, left_on=pl.col(on).cast(pl.String), right_on=on, how='anti')
+
+    def reconcile_local(self, dir_path, checksum=False):
+        """Add files in dir_path the manifest does not know about and drop entries whose file is gone"""
+        files = {f.split('.')[0]: os.path.join(dir_path, f) for f in os.listdir(dir_path) if f.endswith('.mp4')}
+        known = dict(self.conn.execute('SELECT video_id, location FROM media WHERE location NOT LIKE ?', ('s3://%',)).fetchall())
+
+        num_added = 0
+        for video_id, path in files.items():
+            if video_id not in known:
+                sha256 = file_sha256(path) if checksum else None
+                self.record(video_id, os.path.getsize(path), sha256=sha256, location=path, commit=False)
+                num_added += 1
+        removed = [(video_id,) for video_id, path in known.items() if video_id not in files and os.path.dirname(path) == dir_path]
+        self.conn.executemany('DELETE FROM media WHERE video_id = ?', removed)
+        self.conn.commit()
+        print(f"Reconciled {dir_path}: {num_added} added, {len(removed)} removed")
+
+    def reconcile_s3(self, client, bucket, prefix):
+        """Add objects under prefix the manifest does not know about and drop entries whose object is gone.
+
+        Uploads do not arrive in key order, so every run lists the whole prefix, but only objects that
+        are new or changed size are written.
+        """
+        location_prefix = f's3://{bucket}/{prefix}'
+        known = dict(self.conn.execute(
+            'SELECT location, size FROM media WHERE substr(location, 1, ?) = ?', (len(location_prefix), location_prefix)
+        ).fetchall())
+
+        num_listed = 0
+        num_added = 0
+        listed = set()
+        for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                location = f"s3://{bucket}/{obj['Key']}"
+                num_listed += 1
+                listed.add(location)
+                if known.get(location) != obj['Size']:
+                    video_id = obj['Key'][len(prefix):].split('.')[0]
+                    self.record(video_id, obj['Size'], location=location, commit=False)
+                    num_added += 1
+            self.conn.commit()
+
+        removed = [(location,) for location in known if location not in listed]
+        self.conn.executemany('DELETE FROM media WHERE location = ?', removed)
+        self.conn.commit()
+        print(f"Reconciled {location_prefix}: {num_listed} objects listed, {num_added} added, {len(removed)} removed")
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+def main():
+    # python media_manifest.py <manifest path> <media dir | s3://bucket/prefix> [--full], --full checksums local files
+    manifest = MediaManifest(sys.argv[1])
+    target = sys.argv[2]
+    full = '--full' in sys.argv[3:]
+    if target.startswith('s3://'):
+        import boto3
+        bucket, _, prefix = target[len('s3://'):].partition('/')
+        manifest.reconcile_s3(boto3.client('s3'), bucket, prefix)
+    else:
+        manifest.reconcile_local(target, checksum=full)
+    manifest.close()
+
+if __name__ == '__main__':
+    main()
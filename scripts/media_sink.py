@@ -0,0 +1,136 @@
+import hashlib
+import os
+
+class ChecksumMismatchException(Exception):
+    pass
+
+class LocalWriter:
+    def __init__(self, dir_path, key, expected_sha256=None):
+        self.path = os.path.join(dir_path, key)
+        self.tmp_path = os.path.join(dir_path, f'.{key}.part')
+        self.expected_sha256 = expected_sha256
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.f = open(self.tmp_path, 'wb')
+
+    def write(self, chunk):
+        self.f.write(chunk)
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        checksum = self.sha256.hexdigest()
+        if self.expected_sha256 is not None and checksum != self.expected_sha256:
+            os.remove(self.tmp_path)
+            raise ChecksumMismatchException(f"{self.path}: expected {self.expected_sha256}, got {checksum}")
+        # readers only ever see complete files
+        os.replace(self.tmp_path, self.path)
+        return self.size, checksum
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+class S3Writer:
+    def __init__(self, client, bucket, key, part_size, verify, expected_sha256=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.verify = verify
+        self.expected_sha256 = expected_sha256
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def _checksum_args(self):
+        # S3 recomputes and checks the checksum of every part on its side
+        return {'ChecksumAlgorithm': 'SHA256'} if self.verify else {}
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            upload = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self._checksum_args())
+            self.upload_id = upload['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=bytes(self.buffer), **self._checksum_args()
+        )
+        part = {'PartNumber': part_number, 'ETag': response['ETag']}
+        if 'ChecksumSHA256' in response:
+            part['ChecksumSHA256'] = response['ChecksumSHA256']
+        self.parts.append(part)
+        self.buffer = bytearray()
+
+    def write(self, chunk):
+        self.buffer += chunk
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+    def commit(self):
+        checksum = self.sha256.hexdigest()
+        if self.expected_sha256 is not None and checksum != self.expected_sha256:
+            self.abort()
+            raise ChecksumMismatchException(f"{self.key}: expected {self.expected_sha256}, got {checksum}")
+
+        if self.upload_id is None:
+            # small enough to go up in one request
+            self.client.put_object(
+                Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer),
+                Metadata={'sha256': checksum}, **self._checksum_args()
+            )
+        else:
+            if len(self.buffer) > 0:
+                self._upload_part()
+            # the object only becomes visible once the upload is completed
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+        return self.size, checksum
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+
+class LocalSink:
+    """Writes media into a local directory, via a temp file renamed into place when complete"""
+    def __init__(self, dir_path):
+        self.dir_path = dir_path
+        os.makedirs(self.dir_path, exist_ok=True)
+
+    def location(self, key):
+        return os.path.join(self.dir_path, key)
+
+    def open(self, key, expected_sha256=None):
+        return LocalWriter(self.dir_path, key, expected_sha256=expected_sha256)
+
+class S3Sink:
+    """Writes media to an S3 compatible store with multipart uploads of part_size bytes.
+
+    endpoint_url or client can point this at a local stand-in such as MinIO or moto.
+    """
+    def __init__(self, bucket, prefix='', client=None, endpoint_url=None, part_size=8 * 1024 * 1024, verify=False):
+        if client is None:
+            import boto3
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.verify = verify
+
+    def location(self, key):
+        return f's3://{self.bucket}/{self.prefix}{key}'
+
+    def open(self, key, expected_sha256=None):
+        return S3Writer(self.client, self.bucket, f'{self.prefix}{key}', self.part_size, self.verify, expected_sha256=expected_sha256)
@@ -0,0 +1,99 @@
+import collections
+import concurrent.futures
+import contextlib
+import time
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.num_items = 0
+        self.num_errors = 0
+        self.busy = 0
+
+    def record(self, seconds):
+        self.num_items += 1
+        self.busy += seconds
+
+class Stage:
+    def __init__(self, name, fn, executor, max_pending=4):
+        self.name = name
+        self.fn = fn
+        self.executor = executor
+        self.max_pending = max_pending
+
+class StagedPipeline:
+    """Overlaps stages run in thread or process pools, yielding results of the last stage in order.
+
+    Each stage keeps at most max_pending items in flight, which bounds the queue between it and
+    the next stage. A stage returning None or raising drops the item. Work done by the consumer of
+    run(), such as model inference, can be timed with measure(name) to show up in report().
+    """
+    def __init__(self, stages):
+        self.stages = stages
+        self.stats = {stage.name: StageStats(stage.name) for stage in stages}
+        self.start = None
+
+    def _result(self, stage, future):
+        try:
+            result, seconds = future.result()
+        except Exception as ex:
+            print(f"Error in {stage.name} stage: {ex}")
+            self.stats[stage.name].num_errors += 1
+            return None
+        self.stats[stage.name].record(seconds)
+        return result
+
+    def run(self, items):
+        self.start = time.perf_counter()
+        items = iter(items)
+        items_left = True
+        pending = [collections.deque() for _ in self.stages]
+        while True:
+            while items_left and len(pending[0]) < self.stages[0].max_pending:
+                item = next(items, None)
+                if item is None:
+                    items_left = False
+                    break
+                pending[0].append(self.stages[0].executor.submit(_timed, self.stages[0].fn, item))
+
+            # hand finished items on to the next stage, in order, while it has room
+            for i in range(len(self.stages) - 1):
+                while len(pending[i]) > 0 and pending[i][0].done() and len(pending[i + 1]) < self.stages[i + 1].max_pending:
+                    result = self._result(self.stages[i], pending[i].popleft())
+                    if result is not None:
+                        pending[i + 1].append(self.stages[i + 1].executor.submit(_timed, self.stages[i + 1].fn, result))
+
+            if len(pending[-1]) > 0 and pending[-1][0].done():
+                result = self._result(self.stages[-1], pending[-1].popleft())
+                if result is not None:
+                    yield result
+                continue
+
+            heads = [p[0] for p in pending if len(p) > 0]
+            if len(heads) == 0 and not items_left:
+                break
+            # a finished head blocked on a full next stage waits for that stage instead
+            running = [head for head in heads if not head.done()]
+            if len(running) > 0:
+                concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        stats = self.stats.setdefault(name, StageStats(name))
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            stats.num_errors += 1
+            raise
+        stats.record(time.perf_counter() - start)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        for stats in self.stats.values():
+            print(f"{stats.name}: {stats.num_items} items, {stats.num_errors} errors, {stats.num_items / elapsed:.2f} items/s, {stats.busy:.1f}s busy of {elapsed:.1f}s")
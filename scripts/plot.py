@@ -7,13 +7,10 @@ import geopandas as gpd
 import matplotlib.dates as mdates
 from datetime import datetime
 
-def concat(a_df, b_df):
-    try:
-        return pl.concat([a_df, b_df], how='diagonal_relaxed')
-    except (pl.exceptions.SchemaError, pl.exceptions.PanicException):
-        return pl.DataFrame(a_df.to_dicts() + b_df.to_dicts(), infer_schema_length=len(a_df) + len(b_df))
+from corpus import is_fetched_election_file
+from rollup import load_rollup
 
-def create_choropleth_maps(df):
+def create_choropleth_maps(cube_df, rollup):
     # Load European countries shapefile
     # You'll need to download this or use one you already have
     # A good source would be Natural Earth data: https://www.naturalearthdata.com/
@@ -26,23 +23,19 @@ def create_choropleth_maps(df):
         # Example: 'GB': 'United Kingdom', 'DE': 'Germany', etc.
     }
     # Map country codes/names in your data to those in the shapefile
-    iso_map = {c: pycountry.countries.get(alpha_2=c).alpha_3 for c in df['locationCreated'].unique().to_list()}
-    df = df.with_columns(pl.col('locationCreated').replace_strict(iso_map).alias('country_code'))
-    
-    # Prepare data for choropleth maps
-    # 1. Total video count by country
-    total_by_country = df.group_by('country_code').agg(pl.count()).sort('count', descending=True)
-    total_by_country = total_by_country.rename({'count': 'total_videos'})
-    
-    # 2. Videos with 'lasconi' in description
-    lasconi_df = df.filter(pl.col('desc').str.to_lowercase().str.contains('lasconi', literal=True))
-    lasconi_by_country = lasconi_df.group_by('country_code').agg(pl.count()).sort('count', descending=True)
-    lasconi_by_country = lasconi_by_country.rename({'count': 'lasconi_videos'})
-    
-    # 3. Videos with 'georgescu' in description
-    georgescu_df = df.filter(pl.col('desc').str.to_lowercase().str.contains('georgescu', literal=True))
-    georgescu_by_country = georgescu_df.group_by('country_code').agg(pl.count()).sort('count', descending=True)
-    georgescu_by_country = georgescu_by_country.rename({'count': 'georgescu_videos'})
+    iso_map = {c: pycountry.countries.get(alpha_2=c).alpha_3 for c in cube_df['country'].unique().to_list()}
+    
+    # Prepare data for choropleth maps, total videos and videos with 'lasconi' or 'georgescu' in the description
+    by_country = cube_df.group_by('country')\
+        .agg([
+            pl.col('videos').sum().alias('total_videos'),
+            pl.col('videos').filter(rollup.keyword_filter(['lasconi'])).sum().alias('lasconi_videos'),
+            pl.col('videos').filter(rollup.keyword_filter(['georgescu'])).sum().alias('georgescu_videos'),
+        ])\
+        .with_columns(pl.col('country').replace_strict(iso_map).alias('country_code'))
+    total_by_country = by_country.select(['country_code', 'total_videos']).sort('total_videos', descending=True)
+    lasconi_by_country = by_country.filter(pl.col('lasconi_videos') > 0).select(['country_code', 'lasconi_videos']).sort('lasconi_videos', descending=True)
+    georgescu_by_country = by_country.filter(pl.col('georgescu_videos') > 0).select(['country_code', 'georgescu_videos']).sort('georgescu_videos', descending=True)
     
     # Convert Polars DataFrames to Pandas for GeoPandas compatibility
     total_pd = total_by_country.to_pandas()
@@ -82,25 +75,18 @@ def create_choropleth_maps(df):
     
     return total_by_country, lasconi_by_country, georgescu_by_country
 
-def create_time_series(df):
-    # Ensure we have a datetime column to work with
-    # Assuming your data has a 'createTime' column
-    df = df.with_columns(pl.from_epoch(pl.col('createTime').cast(pl.UInt64)).alias('date'))
-    
-    # Group by date and count videos
-    # Daily aggregation
-    total_by_date = df.group_by(pl.col('date').dt.date()).agg(pl.count()).sort('date')
-    total_by_date = total_by_date.rename({'count': 'total_videos'})
-    
-    # Filter for lasconi videos and count by date
-    lasconi_df = df.filter(pl.col('desc').str.to_lowercase().str.contains('lasconi', literal=True))
-    lasconi_by_date = lasconi_df.group_by(pl.col('date').dt.date()).agg(pl.count()).sort('date')
-    lasconi_by_date = lasconi_by_date.rename({'count': 'lasconi_videos'})
-    
-    # Filter for georgescu videos and count by date
-    georgescu_df = df.filter(pl.col('desc').str.to_lowercase().str.contains('georgescu', literal=True))
-    georgescu_by_date = georgescu_df.group_by(pl.col('date').dt.date()).agg(pl.count()).sort('date')
-    georgescu_by_date = georgescu_by_date.rename({'count': 'georgescu_videos'})
+def create_time_series(cube_df, rollup):
+    # Daily video counts, in total and with each keyword
+    by_date = cube_df.group_by(pl.col('day').alias('date'))\
+        .agg([
+            pl.col('videos').sum().alias('total_videos'),
+            pl.col('videos').filter(rollup.keyword_filter(['lasconi'])).sum().alias('lasconi_videos'),
+            pl.col('videos').filter(rollup.keyword_filter(['georgescu'])).sum().alias('georgescu_videos'),
+        ])\
+        .sort('date')
+    total_by_date = by_date.select(['date', 'total_videos'])
+    lasconi_by_date = by_date.filter(pl.col('lasconi_videos') > 0).select(['date', 'lasconi_videos'])
+    georgescu_by_date = by_date.filter(pl.col('georgescu_videos') > 0).select(['date', 'georgescu_videos'])
     
     # Create time series plot
     fig, ax = plt.figure(figsize=(12, 6)), plt.gca()
@@ -143,16 +129,14 @@ def main():
     #         except Exception as e:
     #             print(f"Error processing file {filename}: {e}")
     
-    df = pl.read_parquet('./data/fetched_election_videos.parquet.zstd')
-    df = df.unique('id')
-    df = df.with_columns(pl.col('desc').str.extract_all(r'#(?P<hashtag>[a-zA-Z0-9_]+)').alias('hashtags'))
+    rollup, cube_df = load_rollup(path='./data/rollup/fetched_election_videos', match=is_fetched_election_file)
     
     # Create visualizations
     print("Creating choropleth maps...")
-    total_country, lasconi_country, georgescu_country = create_choropleth_maps(df)
+    total_country, lasconi_country, georgescu_country = create_choropleth_maps(cube_df, rollup)
     
     print("Creating time series plots...")
-    total_time, lasconi_time, georgescu_time = create_time_series(df)
+    total_time, lasconi_time, georgescu_time = create_time_series(cube_df, rollup)
     
     # Print some summary statistics
     print("\nTop countries by total video count:")
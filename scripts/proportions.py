@@ -0,0 +1,66 @@
+import numpy as np
+import polars as pl
+from scipy import stats
+
+CI_METHODS = ['normal', 'wilson', 'beta']
+
+def binomial_ci(successes, total, alpha=0.05, method='normal'):
+    """Binomial confidence intervals over whole arrays of counts.
+
+    Methods follow statsmodels' proportion_confint: normal approximation, wilson score, and beta
+    for the exact Clopper-Pearson interval. Groups with no observations get nan bounds.
+    """
+    successes = np.asarray(successes, dtype=np.float64)
+    total = np.asarray(total, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = successes / total
+        if method == 'normal':
+            z = stats.norm.isf(alpha / 2)
+            half_width = z * np.sqrt(p * (1 - p) / total)
+            # clipped to [0, 1] as statsmodels does
+            lower, upper = np.clip(p - half_width, 0, 1), np.clip(p + half_width, 0, 1)
+        elif method == 'wilson':
+            z = stats.norm.isf(alpha / 2)
+            denom = 1 + z ** 2 / total
+            center = (p + z ** 2 / (2 * total)) / denom
+            half_width = z * np.sqrt(p * (1 - p) / total + z ** 2 / (4 * total ** 2)) / denom
+            lower, upper = center - half_width, center + half_width
+        elif method == 'beta':
+            lower = np.where(successes > 0, stats.beta.ppf(alpha / 2, successes, total - successes + 1), 0.)
+            upper = np.where(successes < total, stats.beta.isf(alpha / 2, successes + 1, total - successes), 1.)
+        else:
+            raise ValueError(f"Unknown method {method}, expected one of {CI_METHODS}")
+    invalid = total <= 0
+    return np.where(invalid, np.nan, lower), np.where(invalid, np.nan, upper)
+
+def with_binomial_ci(df, successes, total='total', alpha=0.05, method='normal', scale=1, prefix=None):
+    """Add {prefix}_percent, {prefix}_ci_lower and {prefix}_ci_upper columns for a count column"""
+    prefix = prefix or successes
+    lower, upper = binomial_ci(df[successes].to_numpy(), df[total].to_numpy(), alpha=alpha, method=method)
+    return df.with_columns([
+        (pl.col(successes) / pl.col(total) * scale).alias(f'{prefix}_percent'),
+        pl.Series(f'{prefix}_ci_lower', lower * scale, dtype=pl.Float64),
+        pl.Series(f'{prefix}_ci_upper', upper * scale, dtype=pl.Float64),
+    ])
+
+def proportions(df, by, flags, alpha=0.05, method='normal', scale=100, every=None, weight=None):
+    """Share of videos matching each flag expression per group, with confidence intervals.
+
+    by is a column or list of columns, such as a hashtag or author, or the time column to bucket
+    with every, such as '1d' or '2w'. flags maps an output name to a boolean expression. All flags
+    are counted in a single aggregation over df, which may be lazy. For pre-aggregated rows, such as
+    the rollup cube, weight names the column holding the number of videos per row.
+    """
+    if weight is None:
+        aggs = [pl.len().alias('total')] + [expr.sum().alias(name) for name, expr in flags.items()]
+    else:
+        aggs = [pl.col(weight).sum().alias('total')] + [pl.col(weight).filter(expr).sum().alias(name) for name, expr in flags.items()]
+    if every is not None:
+        counts_df = df.sort(by).group_by_dynamic(by, every=every).agg(aggs)
+    else:
+        counts_df = df.group_by(by).agg(aggs).sort(by)
+    if isinstance(counts_df, pl.LazyFrame):
+        counts_df = counts_df.collect(engine='streaming')
+    for name in flags:
+        counts_df = with_binomial_ci(counts_df, name, alpha=alpha, method=method, scale=scale)
+    return counts_df
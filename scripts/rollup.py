@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+
+import polars as pl
+
+from corpus import fragment_files, is_video_file, scan_corpus, scan_files
+from keywords import KeywordTagger, election_keywords
+
+ROLLUP_KEYWORDS = election_keywords()
+ROLLUP_KEYS = ['day', 'country', 'keyword_mask', 'aigcLabelType', 'author']
+ROLLUP_SOURCE_COLUMNS = ['id', 'createTime', 'locationCreated', 'desc', 'challenges', 'aigcLabelType', 'author', 'authorStats', 'stats']
+STAT_FIELDS = ['playCount', 'diggCount', 'commentCount', 'shareCount']
+
+def _field(lf, column, field, dtype):
+    schema = lf.collect_schema()
+    if column in schema and isinstance(schema[column], pl.Struct) and field in [f.name for f in schema[column].fields]:
+        return pl.col(column).struct.field(field).cast(dtype).alias(field)
+    return pl.lit(None, dtype=dtype).alias(field)
+
+def rollup_videos(lf, keywords):
+    """Aggregate videos into cube rows"""
+    schema = lf.collect_schema()
+    lf = lf.with_columns([pl.lit(None, dtype=pl.String).alias(c) for c in ['locationCreated', 'aigcLabelType'] if c not in schema])
+    return lf.select([
+        pl.from_epoch(pl.col('createTime').cast(pl.Int64)).dt.date().alias('day'),
+        pl.col('locationCreated').cast(pl.String).alias('country'),
+        KeywordTagger(keywords).mask(schema),
+        pl.col('aigcLabelType').cast(pl.String),
+        _field(lf, 'author', 'uniqueId', pl.String).alias('author'),
+        _field(lf, 'authorStats', 'followerCount', pl.Int64),
+    ] + [_field(lf, 'stats', field, pl.Int64) for field in STAT_FIELDS])\
+        .group_by(ROLLUP_KEYS)\
+        .agg([pl.len().cast(pl.Int64).alias('videos'), pl.col('followerCount').max()] + [pl.col(field).sum() for field in STAT_FIELDS])
+
+def merge_rollups(dfs):
+    return pl.concat(dfs, how='vertical')\
+        .group_by(ROLLUP_KEYS)\
+        .agg([pl.col('videos').sum(), pl.col('followerCount').max()] + [pl.col(field).sum() for field in STAT_FIELDS])
+
+def _generation(path):
+    return int(os.path.basename(path).split('.')[0].split('-')[-1])
+
+def _write(df, dir_path, name):
+    file_path = os.path.join(dir_path, f'{name}.parquet.zstd')
+    tmp_path = os.path.join(dir_path, f'.{name}.tmp')
+    df.write_parquet(tmp_path, compression='zstd')
+    os.replace(tmp_path, file_path)
+    return file_path
+
+class Rollup:
+    """Materialized counts of videos by day, country, keyword mask, AI label and author.
+
+    Each update only aggregates videos whose ids have not been counted before, and merges them into
+    the existing cube, so plots and stats read a table a fraction of the size of the corpus.
+    Every update is a generation, the ids it counted go to ids/{generation} and the merged cube to
+    cube-{generation}, and the cube's rename is what commits it. Ids from a generation whose cube
+    never landed are dropped on open, so a crash never counts a video twice or loses it.
+    Changing the keyword list changes what the mask bits mean, so the cube is rebuilt from scratch.
+    """
+    def __init__(self, path='./data/rollup/corpus', keywords=ROLLUP_KEYWORDS):
+        self.path = path
+        self.tagger = KeywordTagger(keywords)
+        self.keywords = self.tagger.keywords
+        self.ids_path = os.path.join(self.path, 'ids')
+        keywords_path = os.path.join(self.path, 'keywords.json')
+
+        if os.path.exists(keywords_path):
+            with open(keywords_path, 'r') as f:
+                if json.load(f) != self.keywords:
+                    print(f"Keywords changed, rebuilding rollup in {self.path}")
+                    shutil.rmtree(self.path)
+        os.makedirs(self.ids_path, exist_ok=True)
+        with open(keywords_path, 'w') as f:
+            json.dump(self.keywords, f)
+
+        cube_paths = fragment_files(self.path)
+        self.generation = _generation(cube_paths[-1]) if len(cube_paths) > 0 else 0
+        # left behind by a crash after the newest cube landed
+        for cube_path in cube_paths[:-1]:
+            os.remove(cube_path)
+        for ids_path in fragment_files(self.ids_path):
+            if _generation(ids_path) > self.generation:
+                os.remove(ids_path)
+
+        id_df = scan_files(fragment_files(self.ids_path), columns=['id']).collect()
+        self.counted = set(id_df['id'].to_list()) if 'id' in id_df.columns else set()
+
+    def keyword_filter(self, keywords):
+        """Expression matching cube rows whose videos contain any of keywords"""
+        return self.tagger.mask_filter(keywords)
+
+    def cube_path(self, generation):
+        return os.path.join(self.path, f'cube-{generation:08d}.parquet.zstd')
+
+    def load(self):
+        if self.generation == 0:
+            return rollup_videos(pl.LazyFrame(schema={c: pl.String for c in ROLLUP_SOURCE_COLUMNS}), self.keywords).collect()
+        return pl.read_parquet(self.cube_path(self.generation))
+
+    def update(self, lf):
+        """Count videos in lf that are not yet in the cube, returning how many were added"""
+        ids = lf.select(pl.col('id').cast(pl.String)).collect(engine='streaming')['id']
+        new_ids = ids.filter(pl.Series([video_id not in self.counted for video_id in ids]))
+        if len(new_ids) == 0:
+            return 0
+
+        new_df = rollup_videos(lf.filter(pl.col('id').cast(pl.String).is_in(new_ids.implode())), self.keywords).collect(engine='streaming')
+        cube_df = merge_rollups([self.load(), new_df])
+
+        generation = self.generation + 1
+        _write(pl.DataFrame({'id': new_ids}), self.ids_path, f'{generation:08d}')
+        _write(cube_df, self.path, f'cube-{generation:08d}')
+        if self.generation > 0:
+            os.remove(self.cube_path(self.generation))
+        self.generation = generation
+        self.counted.update(new_ids.to_list())
+        return len(new_ids)
+
+def load_rollup(data_dir='./data', path='./data/rollup/corpus', match=is_video_file, keywords=ROLLUP_KEYWORDS):
+    """Bring the rollup of the files in data_dir matching match up to date and return the cube.
+
+    A rollup only ever counts one population, so each match needs its own path.
+    """
+    rollup = Rollup(path, keywords=keywords)
+    lf = scan_corpus(data_dir, match=match)
+    if len(lf.collect_schema()) > 0:
+        num_added = rollup.update(lf.select([c for c in ROLLUP_SOURCE_COLUMNS if c in lf.collect_schema()]))
+        print(f"Added {num_added} videos to the rollup")
+    return rollup, rollup.load()
+
+def main():
+    _, cube_df = load_rollup()
+    print(f"Rollup has {len(cube_df)} rows covering {cube_df['videos'].sum()} videos")
+
+if __name__ == '__main__':
+    main()
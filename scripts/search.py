@@ -2,24 +2,18 @@ import asyncio
 import json
 
 import polars as pl
-from pytok.tiktok import PyTok
 
-hashtag_name = 'romania'
-
-async def main():
-    terms = ['romania', 'bucharest', 'georgescu', 'lasconi']
+from collect_hashtag import ApiWrapper, search_sources
+from collection_runner import CollectionRunner
 
-    async with PyTok(manual_captcha_solves=True) as api:
-        for term in terms:
-            search = api.search(term)
+hashtag_name = 'romania'
 
-            videos = []
-            async for video in search.videos(count=1000):
-                video_info = await video.info()
-                videos.append(video_info)
+TERMS = ['romania', 'bucharest', 'georgescu', 'lasconi']
 
-            df = pl.DataFrame(videos)
-            df.write_parquet(f'./data/{term}.parquet.zstd', compression='zstd')
+async def main(num_sessions=4, stop_after=None):
+    # each term is collected into a video store at ./data/{term}
+    runner = CollectionRunner(search_sources(TERMS), lambda: ApiWrapper('pytok'), num_sessions=num_sessions, stop_after=stop_after)
+    await runner.run()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -8,7 +8,8 @@ from pytok.tiktok import PyTok
 from TikTokApi import TikTokApi
 from tqdm import tqdm
 
-from utils import concat
+from collection_runner import KnownRun
+from video_store import VideoStore
 
 class ApiWrapper:
     def __init__(self, lib):
@@ -38,24 +39,28 @@ class ApiWrapper:
     async def __aexit__(self, exc_type, exc, tb):
         await self.api.__aexit__(exc_type, exc, tb)
 
-async def main():
+async def main(stop_after=None):
     search = 'canada election pen'
     # hashtags.reverse()
 
-    async with PyTok(manual_captcha_solves=True) as api:
-        videos = []
-        async for video in api.search(search).videos(count=200):
-            videos.append(video)
+    with VideoStore(f'./data/search_{search.replace(" ", "_")}') as store:
+        # on a refresh, stop_after=50 stops at the first 50 videos in a row already stored
+        known = KnownRun(store.ids, stop_after)
+        async with PyTok(manual_captcha_solves=True) as api:
+            videos = []
+            async for video in api.search(search).videos(count=200):
+                video_info = video.as_dict
+                if known.stop(video_info['id']):
+                    break
+                videos.append(video_info)
 
+        if len(videos) == 0:
+            return
         df = pl.DataFrame(videos)
         df = df.with_columns(pl.lit(datetime.datetime.today()).alias('scrape_date'))
-        file_path = f'./data/search_{search.replace(" ", "_")}.parquet.zstd'
-        print(f'Saving {len(df)} new videos to {file_path}')
-        if os.path.exists(file_path):
-            existing_df = pl.read_parquet(file_path)
-            df = concat(existing_df, df)
-        df = df.unique('id')
-        df.write_parquet(file_path, compression='zstd')
+        num_new = store.upsert(df)
+        stopped = ', stopped at known videos' if known.stopped else ''
+        print(f'Saved {num_new} new videos of {len(df)} fetched to {store.path}{stopped}')
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,170 @@
+import os
+
+import numpy as np
+import polars as pl
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from video_store import VideoStore
+
+def normalize(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+def spherical_kmeans(x, num_clusters, num_iters=20, sample_size=100_000, seed=0):
+    rng = np.random.default_rng(seed)
+    if len(x) > sample_size:
+        x = x[rng.choice(len(x), sample_size, replace=False)]
+    centroids = x[rng.choice(len(x), num_clusters, replace=False)].copy()
+    for _ in range(num_iters):
+        assignments = np.argmax(x @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, x)
+        empty = np.bincount(assignments, minlength=num_clusters) == 0
+        # reseed clusters that lost all their points
+        sums[empty] = x[rng.choice(len(x), empty.sum(), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+def load_embeddings(transcript_df):
+    """Flatten per-video speaker embeddings into a matrix with the video and speaker of each row"""
+    df = transcript_df.select(['video_id', 'speaker_embeddings'])\
+        .with_columns(pl.int_ranges(pl.col('speaker_embeddings').list.len()).alias('speaker'))\
+        .explode(['speaker_embeddings', 'speaker'])\
+        .drop_nulls('speaker_embeddings')
+    embeddings = np.asarray(df['speaker_embeddings'].cast(pl.Array(pl.Float32, 256)).to_numpy(), dtype=np.float32)
+    # speakers that pyannote could not embed come back as nan
+    valid = np.isfinite(embeddings).all(axis=1) & (np.abs(embeddings).sum(axis=1) > 0)
+    df = df.filter(pl.Series(valid))
+    # fixed width strings rather than objects so the ids can be memory mapped
+    video_ids = df['video_id'].cast(pl.String).to_numpy().astype(str)
+    return normalize(embeddings[valid]), video_ids, df['speaker'].to_numpy()
+
+class SpeakerIndex:
+    """Inverted file index for cosine search over speaker embeddings.
+
+    Embeddings are split into nlist clusters by spherical k-means and stored sorted by cluster, so
+    a query only scans the nprobe clusters whose centroids are closest to it. Everything is a plain
+    numpy array, so a saved index can be memory mapped rather than loaded.
+    """
+    def __init__(self, embeddings, video_ids, speakers, centroids, list_offsets):
+        self.embeddings = embeddings
+        self.video_ids = video_ids
+        self.speakers = speakers
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+
+    @classmethod
+    def build(cls, embeddings, video_ids, speakers, nlist=None, seed=0):
+        if nlist is None:
+            nlist = max(1, int(np.sqrt(len(embeddings))))
+        centroids = spherical_kmeans(embeddings, nlist, seed=seed)
+        assignments = np.empty(len(embeddings), dtype=np.int64)
+        for i in range(0, len(embeddings), 65536):
+            assignments[i:i + 65536] = np.argmax(embeddings[i:i + 65536] @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind='stable')
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))])
+        return cls(embeddings[order], video_ids[order], speakers[order], centroids, list_offsets)
+
+    def save(self, dir_path):
+        os.makedirs(dir_path, exist_ok=True)
+        for name in ['embeddings', 'video_ids', 'speakers', 'centroids', 'list_offsets']:
+            np.save(os.path.join(dir_path, f'{name}.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, dir_path, mmap=True):
+        arrays = {
+            name: np.load(os.path.join(dir_path, f'{name}.npy'), mmap_mode='r' if mmap else None)
+            for name in ['embeddings', 'video_ids', 'speakers', 'centroids', 'list_offsets']
+        }
+        return cls(**arrays)
+
+    def _probe(self, queries, nprobe):
+        nprobe = min(nprobe, len(self.centroids))
+        return np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+    def _blocks(self, queries, nprobe):
+        """Yield (query rows, first index row, similarities) for every probed cluster"""
+        probes = self._probe(queries, nprobe)
+        query_rows = np.repeat(np.arange(len(queries)), probes.shape[1])
+        probed_lists = probes.ravel()
+        order = np.argsort(probed_lists, kind='stable')
+        query_rows, probed_lists = query_rows[order], probed_lists[order]
+        boundaries = np.flatnonzero(np.diff(probed_lists)) + 1
+        for rows, lists in zip(np.split(query_rows, boundaries), np.split(probed_lists, boundaries)):
+            if len(rows) == 0:
+                continue
+            start, end = self.list_offsets[lists[0]], self.list_offsets[lists[0] + 1]
+            if start == end:
+                continue
+            yield rows, start, queries[rows] @ np.asarray(self.embeddings[start:end]).T
+
+    def search(self, queries, k=10, nprobe=8):
+        """Top k most similar stored speakers for each query embedding"""
+        queries = normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        best_sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for rows, start, sims in self._blocks(queries, nprobe):
+            block_k = min(k, sims.shape[1])
+            top = np.argpartition(-sims, block_k - 1, axis=1)[:, :block_k]
+            # merge the block's top k into the running top k of each query
+            merged_sims = np.concatenate([best_sims[rows], np.take_along_axis(sims, top, axis=1)], axis=1)
+            merged_rows = np.concatenate([best_rows[rows], top + start], axis=1)
+            keep = np.argsort(-merged_sims, axis=1)[:, :k]
+            best_sims[rows] = np.take_along_axis(merged_sims, keep, axis=1)
+            best_rows[rows] = np.take_along_axis(merged_rows, keep, axis=1)
+
+        query_idx, rank = np.nonzero(best_rows >= 0)
+        index_rows = best_rows[query_idx, rank]
+        return pl.DataFrame({
+            'query': query_idx,
+            'video_id': np.asarray(self.video_ids)[index_rows],
+            'speaker': np.asarray(self.speakers)[index_rows],
+            'similarity': best_sims[query_idx, rank],
+        }).sort(['query', 'similarity'], descending=[False, True])
+
+    def videos_with_speaker(self, embedding, threshold=0.7, k=100, nprobe=8):
+        return self.search(embedding, k=k, nprobe=nprobe)\
+            .filter(pl.col('similarity') >= threshold)\
+            .drop('query')
+
+    def cluster(self, threshold=0.7, k=10, nprobe=4, batch_size=65536):
+        """Assign a global speaker id to every stored embedding.
+
+        Each embedding is linked to its k nearest neighbours above threshold, and global speaker
+        ids are the connected components of that graph.
+        """
+        num_rows = len(self.embeddings)
+        sources, targets = [], []
+        for batch_start in range(0, num_rows, batch_size):
+            queries = np.asarray(self.embeddings[batch_start:batch_start + batch_size])
+            for rows, start, sims in self._blocks(queries, nprobe):
+                block_k = min(k, sims.shape[1])
+                top = np.argpartition(-sims, block_k - 1, axis=1)[:, :block_k]
+                top_sims = np.take_along_axis(sims, top, axis=1)
+                query_idx, rank = np.nonzero(top_sims >= threshold)
+                sources.append(rows[query_idx] + batch_start)
+                targets.append(top[query_idx, rank] + start)
+
+        sources = np.concatenate(sources) if sources else np.empty(0, dtype=np.int64)
+        targets = np.concatenate(targets) if targets else np.empty(0, dtype=np.int64)
+        graph = coo_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)), shape=(num_rows, num_rows))
+        _, labels = connected_components(graph, directed=False)
+        return pl.DataFrame({
+            'video_id': np.asarray(self.video_ids),
+            'speaker': np.asarray(self.speakers),
+            'global_speaker_id': labels,
+        })
+
+def main():
+    transcript_store = VideoStore('./data/tiktok/transcripts', key='video_id', compact_every=None)
+    embeddings, video_ids, speakers = load_embeddings(transcript_store.load(columns=['video_id', 'speaker_embeddings']))
+    index = SpeakerIndex.build(embeddings, video_ids, speakers)
+    index.save('./data/tiktok/speaker_index')
+
+    cluster_df = index.cluster()
+    cluster_df.write_parquet('./data/tiktok/speaker_clusters.parquet.zstd', compression='zstd')
+    print(f"{len(embeddings)} speaker embeddings in {cluster_df['global_speaker_id'].n_unique()} global speakers")
+
+if __name__ == '__main__':
+    main()
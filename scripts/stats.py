@@ -1,23 +1,18 @@
 import polars as pl
 
-from collect_related_election_videos import filter_related
+from corpus import is_fetched_election_file
+from rollup import load_rollup
 
 def main():
-    df = pl.read_parquet('./data/fetched_election_videos.parquet.zstd')
+    rollup, cube_df = load_rollup(path='./data/rollup/fetched_election_videos', match=is_fetched_election_file)
 
     keywords = [
         'canada', 'election', '51ststate', 'poilievre', 'carney', 'jagmeet', 'bernier', 'blanchet'
     ]
 
-    df = filter_related(df, keywords)
-
-    author_df = df.select([
-        pl.col('author').struct.field('uniqueId'), 
-        pl.col('authorStats').struct.field('followerCount'), 
-        pl.col('stats').struct.field('commentCount'), 
-        pl.col('stats').struct.field('playCount')
-    ]).group_by(['uniqueId'])\
-        .agg([pl.col('followerCount').len().alias('videoCount'), pl.col('followerCount').max().alias('followerCount'), pl.col('playCount').sum(), pl.col('commentCount').sum()])
+    author_df = cube_df.filter(rollup.keyword_filter(keywords))\
+        .group_by(pl.col('author').alias('uniqueId'))\
+        .agg([pl.col('videos').sum().alias('videoCount'), pl.col('followerCount').max().alias('followerCount'), pl.col('playCount').sum(), pl.col('commentCount').sum()])
     
     cols = ['videoCount', 'followerCount', 'playCount', 'commentCount']
 
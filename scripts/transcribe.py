@@ -6,9 +6,16 @@ from PIL import Image
 import polars as pl
 from tqdm import tqdm
 
+import bisect
+import collections
+import concurrent.futures
+import functools
+import itertools
 import gc 
 import json
 import os
+import subprocess
+import tempfile
 
 import dotenv
 from moviepy import VideoFileClip
@@ -20,12 +27,17 @@ from tqdm import tqdm
 import whisperx
 from whisperx.audio import SAMPLE_RATE
 
+from corpus import load_corpus
+from media_manifest import MediaManifest
+from pipeline import Stage, StagedPipeline
+from video_store import VideoStore
+
 def to_df(transcript_data):
     batch_transcript_df = pl.DataFrame(
         {
             'video_id': [d['video_id'] for d in transcript_data],
             'transcript': [d['transcript'] for d in transcript_data],
-            'speaker_embeddings': [[d['speaker_embeddings'][i].astype(np.float64) for i in range(d['speaker_embeddings'].shape[0])] for d in transcript_data],
+            'speaker_embeddings': [[d['speaker_embeddings'][i].astype(np.float32) for i in range(d['speaker_embeddings'].shape[0])] for d in transcript_data],
         },
         schema={
             'video_id': pl.UInt64,
@@ -37,7 +49,7 @@ def to_df(transcript_data):
                     'text': pl.String
                 }))
             }),
-            'speaker_embeddings': pl.List(pl.Array(pl.Float64, 256))
+            'speaker_embeddings': pl.List(pl.Array(pl.Float32, 256))
         }
     )
     return batch_transcript_df
@@ -52,23 +64,151 @@ def try_create_audio(video_path, audio_file_path):
     except AttributeError:
         return False
 
-def apply_whisperx_pipeline(audio, model, diarize_model):
-    device = "cuda" 
-    batch_size = 16 # reduce if low on GPU mem
+def fetch_video(s3, bucket, video_data):
+    file_byte_string = s3.get_object(Bucket=bucket, Key=video_data['key'])['Body'].read()
+    return video_data, file_byte_string
 
-    # 1. Transcribe with original whisper (batched)
+def load_audio_from_bytes(file_byte_string, sr=SAMPLE_RATE):
+    """Decode video bytes straight to mono float32 PCM at sr by piping them through ffmpeg.
+
+    Returns None for videos without an audio track.
+    """
+    def run_ffmpeg(input_path, input_bytes):
+        cmd = [
+            'ffmpeg', '-nostdin', '-threads', '0',
+            '-i', input_path,
+            '-map', '0:a:0',
+            '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sr),
+            'pipe:1'
+        ]
+        return subprocess.run(cmd, input=input_bytes, capture_output=True)
+
+    process = run_ffmpeg('pipe:0', file_byte_string)
+    stderr = process.stderr.decode(errors='replace')
+    if process.returncode != 0 and 'moov atom not found' in stderr:
+        # mp4s with the index at the end need a seekable input
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as f:
+            f.write(file_byte_string)
+            f.flush()
+            process = run_ffmpeg(f.name, None)
+        stderr = process.stderr.decode(errors='replace')
+    if process.returncode != 0:
+        if 'matches no streams' in stderr:
+            return None
+        raise RuntimeError(f"Failed to load audio: {stderr[-1000:]}")
+    if len(process.stdout) == 0:
+        return None
+    return np.frombuffer(process.stdout, np.int16).flatten().astype(np.float32) / 32768.0
+
+def decode_audio(fetched):
+    video_data, file_byte_string = fetched
+    audio = load_audio_from_bytes(file_byte_string)
+    if audio is None:
+        return None
+    return video_data, audio
+
+class AlignModelCache:
+    """LRU of whisperx alignment models keyed by language, evicting once their weights pass max_bytes"""
+    def __init__(self, device, max_bytes=4 * 1024 ** 3):
+        self.device = device
+        self.max_bytes = max_bytes
+        self.models = collections.OrderedDict()
+        self.sizes = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, language):
+        if language in self.models:
+            self.hits += 1
+            self.models.move_to_end(language)
+            return self.models[language]
+
+        self.misses += 1
+        model_a, metadata = whisperx.load_align_model(language_code=language, device=self.device)
+        self.models[language] = (model_a, metadata)
+        self.sizes[language] = sum(p.numel() * p.element_size() for p in model_a.parameters())
+        # always keep the model just loaded, even if it is over budget on its own
+        while sum(self.sizes.values()) > self.max_bytes and len(self.models) > 1:
+            evicted, _ = self.models.popitem(last=False)
+            del self.sizes[evicted]
+            self.evictions += 1
+        if self.evictions > 0 and self.device == 'cuda':
+            torch.cuda.empty_cache()
+        return model_a, metadata
+
+    def preload(self, languages):
+        for language in languages:
+            try:
+                self.get(language)
+            except Exception as ex:
+                print(f"Could not preload alignment model for {language}: {ex}")
+        # preloading should not count towards the run's stats
+        self.misses = 0
+
+    def report(self):
+        print(f"Alignment models: {self.hits} hits, {self.misses} misses, {self.evictions} evictions, {len(self.models)} cached ({sum(self.sizes.values()) / 1e9:.1f}GB)")
+
+def select_backend(device=None, compute_type=None, threads=None):
+    """Pick device, compute type and thread count, defaulting to int8 on all cores without a GPU"""
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    if compute_type is None:
+        compute_type = 'float16' if device == 'cuda' else 'int8'
+    if threads is None:
+        threads = os.cpu_count() if device == 'cpu' else 4
+    torch.set_num_threads(threads)
+    return device, compute_type, threads
+
+def load_whisper_model(device, compute_type, threads):
     # save model to local path (optional)
     # model_dir = "/path/"
     # model = whisperx.load_model("large-v2", device, compute_type=compute_type, download_root=model_dir)
+    return whisperx.load_model("large-v2", device, compute_type=compute_type, threads=threads)
 
-    
-    result = model.transcribe(audio, batch_size=batch_size)
+# silence between packed clips, long enough that VAD never merges speech from two clips into one chunk
+CLIP_GAP_SECONDS = 30
 
-    # delete model if low on GPU resources
-    # import gc; gc.collect(); torch.cuda.empty_cache(); del model
+def transcribe_packed(model, audios, batch_size, language=None):
+    """Transcribe several clips in one call so their VAD segments fill the same inference batches"""
+    gap = np.zeros(CLIP_GAP_SECONDS * SAMPLE_RATE, dtype=np.float32)
+    offsets = []
+    pieces = []
+    position = 0
+    for audio in audios:
+        offsets.append(position / SAMPLE_RATE)
+        pieces.extend([audio, gap])
+        position += len(audio) + len(gap)
+    result = model.transcribe(np.concatenate(pieces), batch_size=batch_size, language=language)
+
+    results = [{'segments': [], 'language': result['language']} for _ in audios]
+    for segment in result['segments']:
+        clip_i = bisect.bisect_right(offsets, segment['start']) - 1
+        offset = offsets[clip_i]
+        results[clip_i]['segments'].append(dict(segment, start=segment['start'] - offset, end=segment['end'] - offset))
+    return results
+
+def transcribe_clips(model, audios, batch_size=16):
+    if len(audios) == 1:
+        return [model.transcribe(audios[0], batch_size=batch_size)]
+
+    # clips are only packed with others in the same language, as language is detected once per call
+    by_language = collections.defaultdict(list)
+    for i, audio in enumerate(audios):
+        by_language[model.detect_language(audio)].append(i)
+
+    results = [None] * len(audios)
+    for language, indices in by_language.items():
+        packed_results = transcribe_packed(model, [audios[i] for i in indices], batch_size, language=language)
+        for i, result in zip(indices, packed_results):
+            results[i] = result
+    return results
+
+def align_and_diarize(result, audio, diarize_model, align_cache):
+    device = align_cache.device
 
     # 2. Align whisper output
-    model_a, metadata = whisperx.load_align_model(language_code=result["language"], device=device)
+    model_a, metadata = align_cache.get(result["language"])
     result = whisperx.align(result["segments"], model_a, metadata, audio, device, return_char_alignments=False)
 
     # delete model if low on GPU resources
@@ -88,99 +228,114 @@ def apply_whisperx_pipeline(audio, model, diarize_model):
     result = whisperx.assign_word_speakers(diarize_segments, result)
     return result, diarize_segments, embeddings
 
+def apply_whisperx_pipeline(audio, model, diarize_model, align_cache):
+    batch_size = 16 # reduce if low on GPU mem
+
+    # 1. Transcribe with original whisper (batched)
+    result = model.transcribe(audio, batch_size=batch_size)
+
+    # delete model if low on GPU resources
+    # import gc; gc.collect(); torch.cuda.empty_cache(); del model
 
-def main():
+    return align_and_diarize(result, audio, diarize_model, align_cache)
+
+
+def main(num_fetch_workers=4, num_decode_workers=2, num_preload_languages=3, device=None, compute_type=None, threads=None, clips_per_batch=1, reconcile=False):
     path = '../sitrep/data/digital_trace/raw_platforms'
-    data_files = os.listdir(path)
-    data_files = [f for f in data_files if f.endswith('.parquet.zstd') and 'tiktok' in f]
 
     bucket = 'media-data-pipeline-raw-data'
     prefix = 'tiktok/bytes/'
 
     s3 = boto3.client('s3')
 
-    paginator = s3.get_paginator('list_objects_v2')
-    pages = paginator.paginate(Bucket=bucket, Prefix=prefix)
-
-    media_files = []
-    media_pbar = tqdm(desc='Finding media files')
-    for page in pages:
-        for obj in page['Contents']:
-            media_files.append(obj['Key'])
-            media_pbar.update(1)
-    media_pbar.close()
-    media_df = pl.DataFrame({'key': media_files})
-    media_df = media_df.with_columns(pl.col('key').str.replace('tiktok/bytes/', '').alias('file_name'))\
-        .with_columns(pl.col('file_name').str.split('.').list.get(0).cast(pl.UInt64).alias('video_id'))
-
-    df = pl.DataFrame()
-    for data_file in tqdm(data_files, desc='Loading data files'):
-        batch_df = pl.read_parquet(f'{path}/{data_file}')
-        df = pl.concat([df, batch_df], how='diagonal_relaxed')
+    # only reads the manifest, new uploads are indexed by
+    # python media_manifest.py ./data/tiktok/media_manifest.sqlite s3://media-data-pipeline-raw-data/tiktok/bytes/
+    # or by listing the bucket here with reconcile=True
+    manifest = MediaManifest('./data/tiktok/media_manifest.sqlite')
+    if reconcile:
+        manifest.reconcile_s3(s3, bucket, prefix)
+    media_df = manifest.load(columns=['video_id', 'location'])
+    media_df = media_df.with_columns(pl.col('location').str.replace(f's3://{bucket}/', '', literal=True).alias('key'))\
+        .with_columns(pl.col('key').str.replace(prefix, '', literal=True).alias('file_name'))\
+        .with_columns(pl.col('video_id').cast(pl.UInt64))\
+        .drop('location')
 
+    df = load_corpus(path, match=lambda f: f.endswith('.parquet.zstd') and 'tiktok' in f, unique_on=None)
     df = df.with_columns(pl.col('video_id').cast(pl.UInt64))
     df = df.join(media_df, on='video_id', how='left')
     df = df.filter(pl.col('file_name').is_not_null())
 
-    transcripts_path = './data/tiktok/transcripts.parquet.zstd'
-    if os.path.exists(transcripts_path):
-        transcript_df = pl.read_parquet(transcripts_path)
-        transcript_df = transcript_df.unique('video_id')
-        df = df.filter(~pl.col('video_id').is_in(transcript_df['video_id']))
-        # TODO remove already processed videos
-        # TODO unique video_id
-    else:
-        transcript_df = pl.DataFrame()
-
-    device = "cuda" 
-    compute_type = "float16" # change to "int8" if low on GPU mem (may reduce accu
-    model = whisperx.load_model("large-v2", device, compute_type=compute_type)
+    # one fragment per batch, compacted offline with python video_store.py ./data/tiktok/transcripts video_id
+    transcript_store = VideoStore('./data/tiktok/transcripts', key='video_id', compact_every=None)
+    df = df.filter(pl.Series([str(video_id) not in transcript_store for video_id in df['video_id']]))
+    df = df.unique('video_id')
+
+    device, compute_type, threads = select_backend(device, compute_type, threads)
+    model = load_whisper_model(device, compute_type, threads)
     diarize_model = Pipeline.from_pretrained("pyannote/speaker-diarization-3.1", use_auth_token=HF_TOKEN).to(torch.device(device))
 
-    tmp_path = './tmp'
+    align_cache = AlignModelCache(device)
+    if 'textLanguage' in df.columns:
+        # most videos will be in one of the corpus' most common languages
+        common_languages = df.drop_nulls('textLanguage')['textLanguage'].value_counts(sort=True)['textLanguage'].head(num_preload_languages).to_list()
+        align_cache.preload(common_languages)
+
     batch_size = 10
     transcript_data = []
-    for video_data in tqdm(df.to_dicts(), desc='Extracting video data'):
-        # download video file
-        key = video_data['key']
-        file_byte_string = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
-
-        # save video file
-        video_path = os.path.join(tmp_path, video_data['file_name'])
-        with open(video_path, 'wb') as f:
-            f.write(file_byte_string)
-            
-        audio_file_path = video_path.replace('.mp4', '.mp3')
 
-        # extract audio
-        success = try_create_audio(video_path, audio_file_path)
-        if not success:
-            continue
-        audio = whisperx.load_audio(audio_file_path)
-
-        # delete audio and video files
-        os.remove(audio_file_path)
-        os.remove(video_path)
+    # fetching and decoding run ahead in pools while the models stay busy on this thread,
+    # decoding happens in ffmpeg subprocesses so threads are enough
+    fetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_fetch_workers)
+    decode_executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_decode_workers)
+    pipeline = StagedPipeline([
+        Stage('fetch', functools.partial(fetch_video, s3, bucket), fetch_executor, max_pending=2 * num_fetch_workers),
+        Stage('decode', decode_audio, decode_executor, max_pending=2 * num_decode_workers),
+    ])
+    pack = []
+    decoded = pipeline.run(df.to_dicts())
+    for video_data, audio in tqdm(itertools.chain(decoded, [(None, None)]), total=len(df), desc='Extracting video data'):
+        # short clips are packed together so each inference batch is full
+        if video_data is not None:
+            pack.append((video_data, audio))
+            if len(pack) < clips_per_batch:
+                continue
+        if len(pack) == 0:
+            break
 
         try:
-            result, diarize_segments, speaker_embeddings = apply_whisperx_pipeline(audio, model, diarize_model)
-            transcript_data.append({
-                'video_id': video_data['video_id'],
-                'transcript': result,
-                'speaker_embeddings': speaker_embeddings
-            })
-        except:
-            continue
-
-        if len(transcript_data) == batch_size:
-            batch_transcript_df = to_df(transcript_data)
-            transcript_df = pl.concat([transcript_df, batch_transcript_df], how='diagonal_relaxed')
-            transcript_df.write_parquet(transcripts_path)
+            with pipeline.measure('transcribe'):
+                results = transcribe_clips(model, [audio for _, audio in pack])
+        except Exception as ex:
+            print(f"Error transcribing pack: {ex}")
+            results = [None] * len(pack)
+
+        for (pack_video_data, pack_audio), result in zip(pack, results):
+            try:
+                if result is None:
+                    continue
+                with pipeline.measure('align_diarize'):
+                    result, diarize_segments, speaker_embeddings = align_and_diarize(result, pack_audio, diarize_model, align_cache)
+                transcript_data.append({
+                    'video_id': pack_video_data['video_id'],
+                    'transcript': result,
+                    'speaker_embeddings': speaker_embeddings
+                })
+            except:
+                continue
+        pack = []
+
+        if len(transcript_data) >= batch_size:
+            transcript_store.upsert(to_df(transcript_data))
             transcript_data = []
 
-    batch_transcript_df = to_df(transcript_data)
-    transcript_df = pl.concat([transcript_df, batch_transcript_df], how='diagonal_relaxed')
-    transcript_df.write_parquet(transcripts_path)
+    fetch_executor.shutdown()
+    decode_executor.shutdown()
+    pipeline.report()
+    align_cache.report()
+
+    if len(transcript_data) > 0:
+        transcript_store.upsert(to_df(transcript_data))
+    transcript_store.close()
 
 if __name__ == '__main__':
     dotenv.load_dotenv()
@@ -1,7 +1,175 @@
+import pyarrow as pa
+import pyarrow.compute as pc
 import polars as pl
 
-def concat(a_df, b_df):
-    try:
-        return pl.concat([a_df, b_df], how='diagonal_relaxed')
-    except (pl.exceptions.SchemaError, pl.exceptions.PanicException):
-        return pl.DataFrame(a_df.to_dicts() + b_df.to_dicts(), infer_schema_length=len(a_df) + len(b_df))
+def _is_list(t):
+    return pa.types.is_list(t) or pa.types.is_large_list(t) or pa.types.is_fixed_size_list(t)
+
+def _is_string(t):
+    return pa.types.is_string(t) or pa.types.is_large_string(t)
+
+def _is_number(t):
+    return pa.types.is_integer(t) or pa.types.is_floating(t)
+
+def _int_supertype(a, b):
+    # mixing signed and unsigned ints of the same width needs the next signed width up
+    if pa.types.is_signed_integer(a) == pa.types.is_signed_integer(b):
+        return a if a.bit_width >= b.bit_width else b
+    unsigned, signed = (a, b) if pa.types.is_unsigned_integer(a) else (b, a)
+    if signed.bit_width > unsigned.bit_width:
+        return signed
+    if unsigned.bit_width < 64:
+        return pa.int64() if unsigned.bit_width == 32 else pa.int32() if unsigned.bit_width == 16 else pa.int16()
+    return pa.float64()
+
+def supertype(a, b, path='', widened=None):
+    """Find a type both a and b can be cast to, recording widened fields in widened"""
+    if a == b:
+        return a
+    if pa.types.is_null(a):
+        return b
+    if pa.types.is_null(b):
+        return a
+
+    if pa.types.is_struct(a) and pa.types.is_struct(b):
+        b_fields = {f.name: f for f in b}
+        fields = []
+        for field in a:
+            if field.name in b_fields:
+                field_type = supertype(field.type, b_fields.pop(field.name).type, f'{path}.{field.name}', widened)
+            else:
+                field_type = field.type
+            fields.append(pa.field(field.name, field_type))
+        # fields only present in b go at the end, same as diagonal concat
+        fields.extend(pa.field(f.name, f.type) for f in b_fields.values())
+        return pa.struct(fields)
+
+    if pa.types.is_fixed_size_list(a) and pa.types.is_fixed_size_list(b) and a.list_size == b.list_size:
+        return pa.list_(supertype(a.value_type, b.value_type, f'{path}[]', widened), a.list_size)
+    if _is_list(a) and _is_list(b):
+        return pa.large_list(supertype(a.value_type, b.value_type, f'{path}[]', widened))
+
+    # numeric rules follow polars' diagonal_relaxed concat
+    if pa.types.is_integer(a) and pa.types.is_integer(b):
+        t = _int_supertype(a, b)
+    elif pa.types.is_boolean(a) and _is_number(b) or pa.types.is_boolean(b) and _is_number(a):
+        t = b if pa.types.is_boolean(a) else a
+    elif pa.types.is_decimal(a) and pa.types.is_decimal(b):
+        t = pa.decimal128(38, max(a.scale, b.scale))
+    elif pa.types.is_decimal(a) and pa.types.is_integer(b) or pa.types.is_decimal(b) and pa.types.is_integer(a):
+        t = pa.decimal128(38, a.scale if pa.types.is_decimal(a) else b.scale)
+    elif (_is_number(a) or pa.types.is_decimal(a)) and (_is_number(b) or pa.types.is_decimal(b)):
+        t = pa.float64()
+    elif pa.types.is_timestamp(a) and pa.types.is_timestamp(b):
+        t = pa.timestamp('us', tz=a.tz or b.tz)
+    elif _is_string(a) and _is_string(b):
+        t = pa.large_string()
+    elif (_is_string(a) or _is_string(b)) and not any(pa.types.is_nested(t) for t in (a, b)):
+        t = pa.large_string()
+    else:
+        raise pl.exceptions.SchemaError(f"Cannot reconcile types {a} and {b} for field '{path}'")
+
+    if widened is not None:
+        widened[path] = (a, b, t)
+    return t
+
+def unify_schemas(schemas, widened=None):
+    fields = {}
+    for schema in schemas:
+        for field in schema:
+            if field.name in fields:
+                fields[field.name] = supertype(fields[field.name], field.type, field.name, widened)
+            else:
+                fields[field.name] = field.type
+    return pa.schema([pa.field(name, t) for name, t in fields.items()])
+
+def conform(arr, target):
+    """Cast an arrow array to target, filling in missing struct fields with nulls"""
+    if isinstance(arr, pa.ChunkedArray):
+        return pa.chunked_array([conform(chunk, target) for chunk in arr.chunks], type=target)
+    if arr.type == target:
+        return arr
+    if pa.types.is_null(arr.type):
+        return pa.nulls(len(arr), type=target)
+    if pa.types.is_struct(target):
+        mask = arr.is_null() if arr.null_count > 0 else None
+        children = {f.name: child for f, child in zip(arr.type, arr.flatten())}
+        return pa.StructArray.from_arrays(
+            [conform(children[f.name], f.type) if f.name in children else pa.nulls(len(arr), type=f.type) for f in target],
+            fields=list(target),
+            mask=mask
+        )
+    if pa.types.is_fixed_size_list(target):
+        mask = arr.is_null() if arr.null_count > 0 else None
+        values = arr.values.slice(arr.offset * target.list_size, len(arr) * target.list_size)
+        return pa.FixedSizeListArray.from_arrays(conform(values, target.value_type), type=target, mask=mask)
+    if pa.types.is_large_list(target):
+        if pa.types.is_fixed_size_list(arr.type):
+            arr = arr.cast(pa.large_list(arr.type.value_type))
+        elif pa.types.is_list(arr.type):
+            arr = arr.cast(pa.large_list(arr.type.value_type))
+        mask = arr.is_null() if arr.null_count > 0 else None
+        # rebase offsets so sliced arrays with nulls are accepted
+        offsets = arr.offsets
+        start, end = offsets[0].as_py(), offsets[-1].as_py()
+        offsets = pc.subtract(offsets, pa.scalar(start, type=offsets.type))
+        values = conform(arr.values.slice(start, end - start), target.value_type)
+        return pa.LargeListArray.from_arrays(offsets, values, type=target, mask=mask)
+    return pc.cast(arr, target)
+
+def _to_arrow(df):
+    # oldest compat level avoids string views, which older pyarrow cannot cast
+    return df.to_arrow(compat_level=pl.CompatLevel.oldest())
+
+def concat_all(dfs, report=None):
+    """Diagonally concatenate frames with drifting nested schemas without going through python objects.
+
+    Frames polars' diagonal_relaxed concat can merge go through it, the rest are reconciled in Arrow.
+    If report is a dict, the Arrow reconcile is always used and report is filled with
+    field path -> (type, type, widened type) for every widened field.
+    """
+    dfs = [df for df in dfs if df.width > 0]
+    if len(dfs) == 0:
+        return pl.DataFrame()
+    if len(dfs) == 1:
+        return dfs[0]
+    if all(df.schema == dfs[0].schema for df in dfs[1:]):
+        return pl.concat(dfs, how='vertical')
+    if report is None:
+        try:
+            return pl.concat(dfs, how='diagonal_relaxed')
+        except (pl.exceptions.PolarsError, pl.exceptions.PanicException):
+            pass
+
+    tables = [_to_arrow(df) for df in dfs]
+    schema = unify_schemas([table.schema for table in tables], widened=report)
+    conformed = []
+    for table in tables:
+        columns = [
+            conform(table.column(field.name), field.type) if field.name in table.column_names else pa.nulls(table.num_rows, type=field.type)
+            for field in schema
+        ]
+        conformed.append(pa.Table.from_arrays(columns, schema=schema))
+    return pl.from_arrow(pa.concat_tables(conformed), rechunk=False)
+
+def concat(a_df, b_df, report=None):
+    return concat_all([a_df, b_df], report=report)
+
+def conform_expr(expr, src, dst):
+    """Polars expression equivalent of conform, for use on lazy frames"""
+    if src == dst:
+        return expr
+    if src == pl.Null:
+        return expr.cast(dst)
+    if isinstance(dst, pl.Struct):
+        src_fields = {f.name: f.dtype for f in src.fields}
+        fields = [
+            conform_expr(expr.struct.field(f.name), src_fields[f.name], f.dtype).alias(f.name) if f.name in src_fields else pl.lit(None, dtype=f.dtype).alias(f.name)
+            for f in dst.fields
+        ]
+        return pl.when(expr.is_not_null()).then(pl.struct(fields))
+    if isinstance(dst, pl.List):
+        if isinstance(src, pl.Array):
+            expr = expr.arr.to_list()
+        return expr.list.eval(conform_expr(pl.element(), src.inner, dst.inner))
+    return expr.cast(dst)
@@ -0,0 +1,53 @@
+import time
+import urllib.parse
+
+# fields a user timeline listing has to carry for collect_users to skip info(), isPinnedItem is
+# only ever set on pinned videos, so its absence means unpinned rather than incomplete
+USER_VIDEO_FIELDS = ['id', 'createTime', 'stats', 'author']
+# fields needed to download a video without looking it up again
+DOWNLOAD_FIELDS = ['id', 'video']
+
+def play_url_fresh(video_info):
+    """Whether the video's play address has not passed the expiry TikTok signs into it"""
+    video = video_info.get('video') or {}
+    url = video.get('playAddr') or video.get('downloadAddr')
+    if not url:
+        return False
+    expires = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get('x-expires')
+    return expires is None or int(expires[0]) > time.time() + 60
+
+class InfoFetcher:
+    """Uses the payload a listing already returned, only calling video.info() when it is incomplete.
+
+    info() is a full HTML page request, so every video whose listing payload has the required
+    fields is a round trip saved. check is an extra test the payload has to pass, such as
+    play_url_fresh for downloads.
+    """
+    def __init__(self, required, check=None):
+        self.required = required
+        self.check = check
+        self.num_videos = 0
+        self.num_info = 0
+
+    def is_complete(self, video_info):
+        if not video_info:
+            return False
+        if any(video_info.get(field) in (None, {}, '') for field in self.required):
+            return False
+        return self.check is None or self.check(video_info)
+
+    async def info(self, video, video_info=None):
+        self.num_videos += 1
+        video_info = video.as_dict if video_info is None else video_info
+        if self.is_complete(video_info):
+            return video_info
+        return await self.full_info(video)
+
+    async def full_info(self, video):
+        self.num_info += 1
+        return await video.info()
+
+    def report(self, name):
+        # a listing payload that turned out stale costs its info() call after all
+        num_saved = self.num_videos - self.num_info
+        print(f"{name}: {self.num_info} info() requests for {self.num_videos} videos, {num_saved} round trips saved")
@@ -0,0 +1,149 @@
+import datetime
+import os
+import sys
+import threading
+import uuid
+
+import polars as pl
+
+from corpus import fragment_files, scan_files
+from utils import concat_all
+
+def fragment_level(path):
+    """Compaction level of a fragment, None for a base file"""
+    name = os.path.basename(path)
+    if name[0].isdigit():
+        return 0
+    prefix = name.split('-')[0]
+    if prefix[0] == 'L' and prefix[1:].isdigit():
+        return int(prefix[1:])
+    return None
+
+class VideoStore:
+    """Append-only store of videos, kept as a directory of parquet fragments.
+
+    Each upsert writes only the videos whose id has not been seen before to a new fragment, so a
+    write costs O(batch) rather than O(corpus). Fragments never share ids, so the union of them is
+    already deduplicated. The id index is the id column of every fragment, read once on open.
+    Compaction is tiered: once a level has more than compact_every fragments they are merged into
+    one fragment of the next level in a background thread, so each video is rewritten about
+    log(n) times and large files are left alone. Upserts write level 0. The legacy file and the
+    output of a full compact() are bases that only a full compaction touches. With
+    compact_every=None nothing is merged until compact() is called.
+    Rows are keyed on the id column unless another key is given.
+    """
+    def __init__(self, path, compact_every=50, key='id'):
+        self.path = path
+        self.key = key
+        self.compact_every = compact_every
+        self.compact_thread = None
+        self.lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+        # adopt the single file this store replaces
+        legacy_path = f'{self.path}.parquet.zstd'
+        if os.path.exists(legacy_path) and len(self.fragments()) == 0:
+            os.replace(legacy_path, os.path.join(self.path, 'legacy.parquet.zstd'))
+
+        self.ids = set()
+        id_df = self.scan(columns=[self.key]).collect()
+        if self.key in id_df.columns:
+            self.ids.update(id_df[self.key].cast(pl.String).to_list())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, video_id):
+        return str(video_id) in self.ids
+
+    def fragments(self):
+        return fragment_files(self.path)
+
+    def scan(self, columns=None):
+        return scan_files(self.fragments(), columns=columns)
+
+    def load(self, columns=None):
+        # a compaction swapping files mid read can briefly expose a fragment twice
+        df = self.scan(columns=columns).collect()
+        if self.key in df.columns:
+            df = df.unique(self.key)
+        return df
+
+    def _write(self, df, name):
+        file_path = os.path.join(self.path, f'{name}.parquet.zstd')
+        tmp_path = os.path.join(self.path, f'.{name}.tmp')
+        df.write_parquet(tmp_path, compression='zstd')
+        os.replace(tmp_path, file_path)
+        return file_path
+
+    def upsert(self, videos):
+        """Add videos whose ids are not already stored, returning how many were new"""
+        df = videos if isinstance(videos, pl.DataFrame) else pl.DataFrame(videos)
+        if len(df) == 0:
+            return 0
+        df = df.unique(self.key)
+        with self.lock:
+            df = df.filter(pl.Series([video_id not in self.ids for video_id in df[self.key].cast(pl.String)]))
+            if len(df) == 0:
+                return 0
+            name = f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+            self._write(df, name)
+            self.ids.update(df[self.key].cast(pl.String).to_list())
+
+        if self.compact_every is not None and self._due_tier()[1]:
+            self.compact(background=True, full=False)
+        return len(df)
+
+    def _due_tier(self):
+        """The lowest level with more than compact_every fragments, and those fragments"""
+        levels = {}
+        for path in self.fragments():
+            level = fragment_level(path)
+            if level is not None:
+                levels.setdefault(level, []).append(path)
+        for level in sorted(levels):
+            if len(levels[level]) > self.compact_every:
+                return level, levels[level]
+        return None, []
+
+    def compact(self, background=False, full=True):
+        """Merge fragments, all of them into one base if full, otherwise the tier that is due"""
+        if self.compact_thread is not None and self.compact_thread.is_alive():
+            return
+        if background:
+            self.compact_thread = threading.Thread(target=self._compact, args=(full,), daemon=True)
+            self.compact_thread.start()
+        else:
+            self._compact(full)
+
+    def _compact(self, full):
+        level, paths = (None, self.fragments()) if full else self._due_tier()
+        if len(paths) < 2:
+            return
+        prefix = 'base' if full else f'L{level + 1}'
+        df = concat_all([pl.read_parquet(path) for path in paths])
+        self._write(df, f"{prefix}-{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}")
+        # fragments written while compacting are left for the next round
+        for path in paths:
+            os.remove(path)
+
+    def close(self):
+        if self.compact_thread is not None:
+            self.compact_thread.join()
+
+def main():
+    # offline compaction, python video_store.py <store path> [key]
+    key = sys.argv[2] if len(sys.argv) > 2 else 'id'
+    store = VideoStore(sys.argv[1], key=key)
+    num_fragments = len(store.fragments())
+    store.compact()
+    print(f"Compacted {num_fragments} fragments of {len(store)} rows in {store.path}")
+
+if __name__ == '__main__':
+    main()
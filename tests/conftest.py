@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the scripts import each other by bare module name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
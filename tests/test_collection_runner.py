@@ -0,0 +1,39 @@
+import asyncio
+
+from collection_runner import CollectionRunner, Source
+from video_info import InfoFetcher
+
+class FakeVideo:
+    def __init__(self, video_id, complete):
+        self.id = video_id
+        self.as_dict = {'id': video_id, 'createTime': 1, 'stats': {'playCount': 1}, 'author': {'uniqueId': 'a'}} if complete else {'id': video_id}
+
+    async def info(self):
+        return {'id': self.id, 'createTime': 1, 'stats': {'playCount': 1}, 'author': {'uniqueId': 'a'}}
+
+class FakeApi:
+    def __init__(self):
+        self.fetcher = InfoFetcher(['id', 'createTime', 'stats', 'author'])
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def search(self, term, known):
+        return [await self.fetcher.info(FakeVideo(f'{term}{i}', complete=i % 2 == 0)) for i in range(10)]
+
+def test_runner_reports_fetcher_counters(tmp_path, capsys):
+    sources = [
+        Source(f'search {term}', str(tmp_path / term), lambda api, known, term=term: api.search(term, known))
+        for term in ['a', 'b', 'c']
+    ]
+    runner = CollectionRunner(sources, FakeApi, num_sessions=2)
+    asyncio.run(runner.run())
+
+    assert sum(fetcher.num_videos for fetcher in runner.fetchers.values()) == 30
+    assert sum(fetcher.num_info for fetcher in runner.fetchers.values()) == 15
+    out = capsys.readouterr().out
+    assert 'search a: 10 videos, 10 new' in out
+    assert all(f'Session {session_id}: ' in out for session_id in runner.fetchers)
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from bench_related_crawl import FakeTikTok, synthetic_videos
+from crawler import RelatedCrawler
+from frontier import Frontier
+
+def make_crawler(videos, api_factory, on_failure=None, num_sessions=4):
+    frontier = Frontier()
+    for item in [v['info'] for v in list(videos.values())[:5]]:
+        frontier.push(item)
+    fetched = []
+
+    def save_result(item, depth, video_info, related_videos):
+        fetched.append(video_info['id'])
+        for related in related_videos:
+            frontier.push(related, depth=depth + 1)
+
+    crawler = RelatedCrawler(frontier, api_factory, save_result, on_failure=on_failure, num_sessions=num_sessions, request_delay=0)
+    return crawler, fetched
+
+def test_crawl_fetches_every_reachable_video():
+    videos = synthetic_videos(200, 5, 1.0)
+    crawler, fetched = make_crawler(videos, lambda: FakeTikTok(videos, 0))
+    asyncio.run(asyncio.wait_for(crawler.run(), timeout=10))
+    assert len(fetched) == len(set(fetched))
+    assert len(fetched) > 5
+
+def test_raising_on_failure_does_not_hang():
+    videos = synthetic_videos(50, 5, 1.0)
+    # half the videos are missing from the backend, so their info() fails
+    backend = {video_id: v for video_id, v in videos.items() if int(video_id) % 2 == 0}
+
+    def on_failure(item, depth):
+        raise RuntimeError("on_failure failed")
+
+    crawler, _ = make_crawler(videos, lambda: FakeTikTok(backend, 0), on_failure=on_failure)
+    asyncio.run(asyncio.wait_for(crawler.run(), timeout=10))
+    assert sum(crawler.session_failures.values()) > 0
+
+def test_session_that_fails_to_open_stops_the_crawl():
+    videos = synthetic_videos(200, 5, 1.0)
+    num_opened = 0
+
+    def api_factory():
+        nonlocal num_opened
+        num_opened += 1
+        if num_opened == 2:
+            raise RuntimeError("browser failed to launch")
+        return FakeTikTok(videos, 0.01)
+
+    async def run():
+        crawler, _ = make_crawler(videos, api_factory)
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(crawler.run(), timeout=10)
+        # no session is left running once the crawl has failed
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
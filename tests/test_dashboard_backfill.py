@@ -0,0 +1,83 @@
+import collections
+import datetime
+import http.server
+import json
+import threading
+
+import polars as pl
+import pytest
+
+import dashboard_backfill
+from dashboard_backfill import DashboardBackfill
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        params = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        day = params['from_date']
+        self.server.requests[day] += 1
+        status, headers, body = self.server.respond(day, self.server.requests[day])
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = collections.Counter()
+    server.mixed_types = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+def respond(server):
+    def _respond(day, attempt):
+        if day == '02-01-2024' and attempt == 1:
+            return 429, {'Retry-After': '7'}, {}
+        if day == '03-01-2024' and attempt < 3:
+            return 503, {}, {}
+        if day == '04-01-2024':
+            # an empty window comes back as null
+            return 200, {}, None
+        if day == '05-01-2024' and server.mixed_types:
+            return 200, {}, [{'id': '5', 'stats': {'playCount': 1}}, {'id': '6', 'stats': [1]}]
+        return 200, {}, {'data': [{'id': day, 'stats': {'playCount': 1}}]}
+    return _respond
+
+def test_backfill_retries_and_resumes(stub, tmp_path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(dashboard_backfill.time, 'sleep', sleeps.append)
+    stub.respond = respond(stub)
+    endpoint = f'http://127.0.0.1:{stub.server_port}/dashboard'
+    start, end = datetime.date(2024, 1, 1), datetime.date(2024, 1, 6)
+
+    backfill = DashboardBackfill(endpoint, 'token', str(tmp_path), num_workers=2, base_delay=0.001)
+    windows = {window_start.day: videos for window_start, _, videos in backfill.run(start, end)}
+    backfill.close()
+
+    # the window whose rows cannot be written is failed, not fatal, and everything else lands
+    assert sorted(windows) == [1, 2, 3, 4]
+    assert windows[4] == []
+    assert stub.requests['02-01-2024'] == 2
+    assert stub.requests['03-01-2024'] == 3
+    assert 7 in sleeps
+    assert backfill.num_failed == 1
+    assert pl.read_parquet(backfill.window_path(datetime.date(2024, 1, 3), datetime.date(2024, 1, 4)))['id'].to_list() == ['03-01-2024']
+
+    stub.mixed_types = False
+    backfill = DashboardBackfill(endpoint, 'token', str(tmp_path), num_workers=2, base_delay=0.001)
+    windows = [window_start.day for window_start, _, _ in backfill.run(start, end)]
+    backfill.close()
+
+    # only the failed window is fetched again
+    assert windows == [5]
+    assert sum(stub.requests.values()) == 1 + 2 + 3 + 1 + 2
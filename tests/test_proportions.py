@@ -0,0 +1,19 @@
+import numpy as np
+
+from proportions import binomial_ci
+
+def test_binomial_ci_matches_statsmodels():
+    # proportion_confint(1, 3, method=...) from statsmodels
+    expected = {
+        'normal': (0.0, 0.8668),
+        'wilson': (0.0615, 0.7923),
+        'beta': (0.0084, 0.9057),
+    }
+    for method, (lower, upper) in expected.items():
+        ci_lower, ci_upper = binomial_ci([1], [3], method=method)
+        np.testing.assert_allclose([ci_lower[0], ci_upper[0]], [lower, upper], atol=1e-4)
+
+def test_normal_ci_is_clipped():
+    lower, upper = binomial_ci([0, 1, 3, 2], [5, 3, 3, 0], method='normal')
+    assert np.all(lower[:3] >= 0) and np.all(upper[:3] <= 1)
+    assert np.isnan(lower[3]) and np.isnan(upper[3])
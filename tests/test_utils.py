@@ -0,0 +1,33 @@
+import decimal
+
+import polars as pl
+
+from corpus import scan_files
+from utils import concat_all
+
+def test_concat_all_widens_bool_and_decimal():
+    df = concat_all([
+        pl.DataFrame({'id': ['1'], 'flag': [True], 'amount': [decimal.Decimal('1.5')]}),
+        pl.DataFrame({'id': ['2'], 'flag': [2], 'amount': [2.5]}),
+    ])
+    assert df['flag'].to_list() == [1, 2]
+    assert df['amount'].to_list() == [1.5, 2.5]
+
+def test_concat_all_reconciles_nested_drift_in_arrow():
+    report = {}
+    df = concat_all([
+        pl.DataFrame({'id': ['1'], 'stats': [{'playCount': 1}], 'flag': [True]}),
+        pl.DataFrame({'id': ['2'], 'stats': [{'playCount': 2.5, 'diggCount': 3}], 'flag': [1]}),
+    ], report=report)
+    assert df['stats'].to_list() == [{'playCount': 1.0, 'diggCount': None}, {'playCount': 2.5, 'diggCount': 3}]
+    assert df['flag'].to_list() == [1, 1]
+    assert set(report) == {'stats.playCount', 'flag'}
+
+def test_scan_files_skips_irreconcilable_files(tmp_path, capsys):
+    paths = [str(tmp_path / f'{i}.parquet.zstd') for i in range(3)]
+    pl.DataFrame({'id': ['1'], 'stats': [{'playCount': 1}]}).write_parquet(paths[0])
+    pl.DataFrame({'id': ['2'], 'stats': [True]}).write_parquet(paths[1])
+    pl.DataFrame({'id': ['3'], 'stats': [{'playCount': 2}], 'flag': [True]}).write_parquet(paths[2])
+    df = scan_files(paths).collect()
+    assert sorted(df['id'].to_list()) == ['1', '3']
+    assert paths[1] in capsys.readouterr().out
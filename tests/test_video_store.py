@@ -0,0 +1,44 @@
+import polars as pl
+
+from corpus import scan_files
+from video_store import VideoStore
+
+def test_reopen_store_with_mismatched_fragments(tmp_path):
+    # a legacy file with a column the newer fragments do not have
+    pl.DataFrame({'id': ['1', '2'], 'desc': ['a', 'b'], 'extra': [1, 2]})\
+        .write_parquet(tmp_path / 'videos.parquet.zstd', compression='zstd')
+    store = VideoStore(str(tmp_path / 'videos'))
+    store.upsert(pl.DataFrame({'id': ['3'], 'desc': ['c']}))
+    store.close()
+
+    store = VideoStore(str(tmp_path / 'videos'))
+    assert store.ids == {'1', '2', '3'}
+    assert sorted(store.load(columns=['id', 'desc'])['desc'].to_list()) == ['a', 'b', 'c']
+    df = store.load()
+    assert df.filter(pl.col('id') == '3')['extra'].to_list() == [None]
+
+def test_scan_files_projects_after_grouping(tmp_path):
+    paths = []
+    for i, columns in enumerate([{'id': ['1']}, {'id': ['2'], 'extra': [1]}, {'id': ['3'], 'other': ['x']}]):
+        path = str(tmp_path / f'{i}.parquet.zstd')
+        pl.DataFrame(columns).write_parquet(path, compression='zstd')
+        paths.append(path)
+    for order in [paths, paths[::-1]]:
+        df = scan_files(order, columns=['id', 'extra']).collect()
+        assert sorted(df['id'].to_list()) == ['1', '2', '3']
+
+def test_tiered_compaction_leaves_base_alone(tmp_path):
+    pl.DataFrame({'id': [str(i) for i in range(1000)]}).write_parquet(tmp_path / 'videos.parquet.zstd', compression='zstd')
+    store = VideoStore(str(tmp_path / 'videos'), compact_every=4)
+    base_mtime = (tmp_path / 'videos' / 'legacy.parquet.zstd').stat().st_mtime_ns
+    for i in range(1000, 1100):
+        store.upsert(pl.DataFrame({'id': [str(i)]}))
+        store.close()
+    assert (tmp_path / 'videos' / 'legacy.parquet.zstd').stat().st_mtime_ns == base_mtime
+    assert len(store.fragments()) < 20
+
+    store = VideoStore(str(tmp_path / 'videos'))
+    assert len(store) == 1100
+    store.compact()
+    assert len(store.fragments()) == 1
+    assert len(VideoStore(str(tmp_path / 'videos'))) == 1100